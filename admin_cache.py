@@ -0,0 +1,52 @@
+# admin_cache.py
+"""
+Кэш администраторов чатов для is_admin.
+
+Список админов хранится ADMIN_CACHE_TTL секунд, самые давно
+использованные чаты вытесняются (LRU), а одновременные запросы
+по одному чату делят один вызов getChatAdministrators.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+from config import ADMIN_CACHE_SIZE, ADMIN_CACHE_TTL
+
+# chat_id -> (момент загрузки, id админов)
+_cache: OrderedDict[int, tuple[float, frozenset[int]]] = OrderedDict()
+_inflight: dict[int, asyncio.Task] = {}
+
+
+async def _fetch(chat) -> frozenset[int]:
+    task = asyncio.current_task()
+    try:
+        admins = await chat.get_administrators()
+        ids = frozenset(a.user.id for a in admins)
+        # Если кэш сбросили во время запроса, ответ мог устареть — не сохраняем
+        if _inflight.get(chat.id) is task:
+            _cache[chat.id] = (time.monotonic(), ids)
+            _cache.move_to_end(chat.id)
+            while len(_cache) > ADMIN_CACHE_SIZE:
+                _cache.popitem(last=False)
+        return ids
+    finally:
+        if _inflight.get(chat.id) is task:
+            del _inflight[chat.id]
+
+
+async def get_admin_ids(chat) -> frozenset[int]:
+    entry = _cache.get(chat.id)
+    if entry is not None and time.monotonic() - entry[0] < ADMIN_CACHE_TTL:
+        _cache.move_to_end(chat.id)
+        return entry[1]
+
+    task = _inflight.get(chat.id)
+    if task is None:
+        task = _inflight[chat.id] = asyncio.create_task(_fetch(chat))
+    # shield: отмена одного ожидающего не отменяет запрос для остальных
+    return await asyncio.shield(task)
+
+
+def invalidate(chat_id: int):
+    _cache.pop(chat_id, None)
+    _inflight.pop(chat_id, None)
@@ -0,0 +1,153 @@
+# bench/fakes.py
+"""
+Локальные заменители внешних сервисов для бенчмарка: Telegram Bot API,
+календарь праздников и YandexGPT на одном отдельном http_server.Server.
+Задержка и лимиты настраиваются, а Telegram запоминает момент каждой
+доставленной отправки.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from datetime import date
+from urllib.parse import parse_qs
+
+from http_server import Request, Response, Server
+
+from yandex_gpt import NAME_PLACEHOLDER
+
+
+def _json(data, status: int = 200) -> Response:
+    return Response(status, json.dumps(data, ensure_ascii=False).encode(), "application/json")
+
+
+async def _delay(latency: float):
+    if latency > 0:
+        # ±50% вокруг средней задержки
+        await asyncio.sleep(random.uniform(0.5, 1.5) * latency)
+
+
+class FakeTelegram:
+    """
+    sendMessage/getMe с лимитами Bot API: global_rate сообщений в секунду
+    на бота и chat_rate_per_min в минуту на чат; сверх лимита — 429
+    с retry_after, как у настоящего API.
+    """
+
+    def __init__(self, token: str, latency: float, global_rate: float, chat_rate_per_min: float):
+        self.token = token
+        self.latency = latency
+        self.global_rate = global_rate
+        self.chat_rate_per_min = chat_rate_per_min
+        # (chat_id, момент доставки)
+        self.sent: list[tuple[int, float]] = []
+        self.webhook: dict | None = None
+        self.requests = 0
+        self.throttled = 0
+        self._global: deque[float] = deque()
+        self._per_chat: dict[int, deque[float]] = {}
+        self._message_id = 0
+
+    def install(self, server: Server):
+        base = f"/bot{self.token}"
+        server.add_route("POST", f"{base}/getMe", self._get_me)
+        server.add_route("POST", f"{base}/sendMessage", self._send_message)
+        server.add_route("POST", f"{base}/setWebhook", self._set_webhook)
+        server.add_route("POST", f"{base}/deleteWebhook", self._delete_webhook)
+
+    async def _get_me(self, request: Request) -> Response:
+        return _json({
+            "ok": True,
+            "result": {
+                "id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot",
+                "can_join_groups": True, "can_read_all_group_messages": False,
+                "supports_inline_queries": False,
+            },
+        })
+
+    async def _set_webhook(self, request: Request) -> Response:
+        self.webhook = {k: v[0] for k, v in parse_qs(request.body.decode()).items()}
+        return _json({"ok": True, "result": True})
+
+    async def _delete_webhook(self, request: Request) -> Response:
+        self.webhook = None
+        return _json({"ok": True, "result": True})
+
+    @staticmethod
+    def _over_limit(window: deque[float], now: float, period: float, limit: float) -> float:
+        """Сколько ждать до освобождения места в окне (0 — можно)."""
+        while window and now - window[0] >= period:
+            window.popleft()
+        if len(window) < limit:
+            window.append(now)
+            return 0.0
+        return period - (now - window[0])
+
+    async def _send_message(self, request: Request) -> Response:
+        self.requests += 1
+        params = {k: v[0] for k, v in parse_qs(request.body.decode()).items()}
+        chat_id = int(params["chat_id"])
+        await _delay(self.latency)
+
+        now = time.monotonic()
+        wait = self._over_limit(self._global, now, 1.0, self.global_rate)
+        if not wait:
+            window = self._per_chat.setdefault(chat_id, deque())
+            wait = self._over_limit(window, now, 60.0, self.chat_rate_per_min)
+            if wait:
+                self._global.pop()
+        if wait:
+            self.throttled += 1
+            retry_after = max(1, int(wait + 0.999))
+            return _json({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }, status=429)
+
+        self._message_id += 1
+        self.sent.append((chat_id, time.monotonic()))
+        return _json({
+            "ok": True,
+            "result": {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup", "title": "bench"},
+                "text": params.get("text", ""),
+            },
+        })
+
+
+class FakeUpstreams:
+    """Календарь (/holidays) и YandexGPT (/completion) с задержкой и долей сбоев."""
+
+    def __init__(self, holidays_latency: float, llm_latency: float, llm_error_rate: float):
+        self.holidays_latency = holidays_latency
+        self.llm_latency = llm_latency
+        self.llm_error_rate = llm_error_rate
+        self.holidays_requests = 0
+        self.llm_requests = 0
+
+    def install(self, server: Server):
+        server.add_route("GET", "/holidays", self._holidays)
+        server.add_route("POST", "/completion", self._completion)
+
+    async def _holidays(self, request: Request) -> Response:
+        self.holidays_requests += 1
+        await _delay(self.holidays_latency)
+        today = date.today().isoformat()
+        return _json([
+            {"date": today, "holidayName": f"Праздник №{i}"} for i in range(1, 4)
+        ])
+
+    async def _completion(self, request: Request) -> Response:
+        self.llm_requests += 1
+        await _delay(self.llm_latency)
+        if random.random() < self.llm_error_rate:
+            return _json({"error": "unavailable"}, status=503)
+        prompt = json.loads(request.body)["messages"][-1]["text"]
+        name = NAME_PLACEHOLDER if NAME_PLACEHOLDER in prompt else prompt.rsplit(": ", 1)[-1].rstrip(".")
+        text = f"🎉 С днём рождения, {name}! Вариант {random.randint(1, 10 ** 6)}"
+        return _json({"result": {"alternatives": [{"message": {"text": text}}]}})
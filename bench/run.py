@@ -0,0 +1,311 @@
+# bench/run.py
+"""
+Бенчмарк ежедневной рассылки на заменителях внешних сервисов.
+
+Заполняет базу N чатами и M днями рождения, ставит всем чатам рассылку
+на текущую минуту и прогоняет настоящие scheduler_tick и рассылку
+против локальных Telegram Bot API, календаря и YandexGPT (bench/fakes.py).
+Сеть наружу не нужна.
+
+Запуск из корня репозитория:
+
+    python -m bench.run --chats 2000 --birthdays 20000
+    python -m bench.run --dsn postgresql://user@localhost/bench   # PostgreSQL
+
+Отчёт: время построения плана на сутки, длительность тика, время
+постановки сообщений в outbox, разброс моментов доставки, число запросов
+к БД, память. --json PATH дополнительно сохраняет отчёт в файл.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+TOKEN = "1:bench"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--birthdays", type=int, default=10000)
+    parser.add_argument(
+        "--today-share", type=float, default=0.05,
+        help="доля дней рождения, приходящихся на сегодня",
+    )
+    parser.add_argument("--dsn", help="PostgreSQL вместо временного файла SQLite")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--tg-latency", type=float, default=0.03)
+    parser.add_argument("--tg-rate", type=float, default=30, help="сообщений в секунду на бота")
+    parser.add_argument("--tg-chat-rate", type=float, default=20, help="сообщений в минуту на чат")
+    parser.add_argument("--holidays-latency", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--no-pool", action="store_true",
+        help="не прогревать пул шаблонов: поздравления генерируются по одному",
+    )
+    parser.add_argument("--trace-memory", action="store_true", help="пик аллокаций tracemalloc")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="логи бота уровня INFO")
+    parser.add_argument("--json", dest="json_path")
+    return parser.parse_args(argv)
+
+
+def configure_env(args, tmpdir: str):
+    """Конфигурация читается при импорте config — задаём её до импорта модулей бота."""
+    base = f"http://127.0.0.1:{args.port}"
+    os.environ.update({
+        "BOT_TOKEN": TOKEN,
+        "RUS_CALENDAR_BASE": base,
+        "HOLIDAYS_CACHE_PATH": "",
+        "YANDEX_API_KEY": "bench",
+        "YANDEX_FOLDER_ID": "bench",
+        "YANDEX_ENDPOINT": f"{base}/completion",
+        "TELEGRAM_GLOBAL_RATE": str(args.tg_rate),
+        "TELEGRAM_CHAT_RATE_PER_MIN": str(args.tg_chat_rate),
+        "HTTP_PORT": "0",
+    })
+    if args.dsn:
+        os.environ.update({"DB_BACKEND": "postgres", "DATABASE_URL": args.dsn})
+    else:
+        os.environ.update({"DB_BACKEND": "sqlite", "DB_PATH": os.path.join(tmpdir, "bench.db")})
+
+
+def seed(args):
+    """N чатов с рассылкой в текущую минуту и M дней рождения."""
+    import db
+    import schedule
+    from config import DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE
+
+    rnd = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    offset = schedule.utc_offset(None)
+    local_now = now + timedelta(minutes=offset)
+    today = local_now.date()
+    chat_ids = [-1001000000000 - i for i in range(args.chats)]
+
+    with db.transaction():
+        for chat_id in chat_ids:
+            db.register_chat(chat_id, DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
+            db.set_chat_time(chat_id, local_now.hour, local_now.minute)
+        for i in range(args.birthdays):
+            if rnd.random() < args.today_share:
+                day = today.replace(year=2000)
+            else:
+                # 2000 — високосный, 29 февраля тоже встречается
+                day = datetime(2000, 1, 1).date() + timedelta(days=rnd.randrange(366))
+            db.add_birthday(
+                10_000 + i, rnd.choice(chat_ids), f"User{i}", day.isoformat()
+            )
+    return chat_ids
+
+
+class QueryCounter:
+    """Число SQL-выражений SQLite (через trace callback соединения)."""
+
+    def __init__(self):
+        self.count = 0
+        # Опрос очереди самим бенчмарком не считаем
+        self.paused = False
+
+    def __call__(self, statement):
+        if not self.paused:
+            self.count += 1
+
+    def install(self):
+        import db
+        storage = db.get_storage()
+        if hasattr(storage, "get_conn"):
+            storage.get_conn().set_trace_callback(self)
+            return True
+        return False
+
+
+def outbox_pending(queries: QueryCounter) -> int:
+    """Сколько сообщений ждёт в outbox — в потоке БД, мимо метрик db.py."""
+    import db
+    queries.paused = True
+    try:
+        return db.get_storage().get_outbox_backlog()[0]
+    finally:
+        queries.paused = False
+
+
+def db_operation_counts() -> dict[str, int]:
+    import metrics
+    return {labels[0]: count for labels, count in metrics.DB_SECONDS.counts().items()}
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args) -> dict:
+    import db
+    import dayplan
+    import db_async
+    import greeting_pool
+    import handlers
+    import holidays
+    import http_client
+    import http_server
+    import outbox
+    import schedule
+    from bench.fakes import FakeTelegram, FakeUpstreams
+    from telegram.ext import ApplicationBuilder, CallbackContext
+
+    telegram = FakeTelegram(TOKEN, args.tg_latency, args.tg_rate, args.tg_chat_rate)
+    upstreams = FakeUpstreams(args.holidays_latency, args.llm_latency, args.llm_error_rate)
+    fake_server = http_server.Server()
+    telegram.install(fake_server)
+    upstreams.install(fake_server)
+    await fake_server.start("127.0.0.1", args.port)
+
+    app = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{args.port}/bot")
+        .job_queue(None)
+        .build()
+    )
+    await app.initialize()
+    # Приложение «запущено» без получения апдейтов: create_task отслеживает задачи
+    await app.start()
+    context = CallbackContext(app)
+    outbox.start(app.bot)
+
+    if not args.no_pool:
+        await greeting_pool.refill(rotate=False)
+    await holidays.ensure_holidays_async()
+    # Запросы прогрева не учитываем — в отчёте только сама рассылка
+    llm_before = upstreams.llm_requests
+
+    schedule.load(db.get_chat_slots())
+    # План на сутки строится после полуночи, а не в момент рассылки
+    started = time.monotonic()
+    await dayplan.build()
+    plan_seconds = time.monotonic() - started
+
+    queries = QueryCounter()
+    counted_sql = queries.install()
+    ops_before = db_operation_counts()
+
+    started = time.monotonic()
+    await handlers.scheduler_tick(context)
+    tick_seconds = time.monotonic() - started
+
+    sends = [t for t in asyncio.all_tasks() if (t.get_name() or "").startswith("daily_send_")]
+    await asyncio.gather(*sends)
+    queued_seconds = time.monotonic() - started
+    # Доставку ведёт outbox — ждём, пока очередь опустеет
+    while await db_async.run(outbox_pending, queries):
+        await asyncio.sleep(0.05)
+    total_seconds = time.monotonic() - started
+
+    ops_after = db_operation_counts()
+    delivered = [t - started for _, t in telegram.sent]
+    report = {
+        "backend": "postgres" if args.dsn else "sqlite",
+        "chats": args.chats,
+        "birthdays": args.birthdays,
+        "plan_seconds": round(plan_seconds, 3),
+        "tick_seconds": round(tick_seconds, 4),
+        "queued_seconds": round(queued_seconds, 3),
+        "send_total_seconds": round(total_seconds, 3),
+        "delivered": len(delivered),
+        "delivery_first": round(min(delivered, default=0), 3),
+        "delivery_p50": round(percentile(delivered, 0.5), 3),
+        "delivery_p95": round(percentile(delivered, 0.95), 3),
+        "delivery_last": round(max(delivered, default=0), 3),
+        "telegram_requests": telegram.requests,
+        "telegram_throttled": telegram.throttled,
+        "llm_requests": upstreams.llm_requests - llm_before,
+        "greeting_pool_size": greeting_pool.size(),
+        "db_operations": {
+            op: count - ops_before.get(op, 0)
+            for op, count in sorted(ops_after.items())
+            if count - ops_before.get(op, 0)
+        },
+        "sql_statements": queries.count if counted_sql else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if tracemalloc.is_tracing():
+        report["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+
+    await outbox.stop()
+    await app.stop()
+    await app.shutdown()
+    await http_client.close()
+    await fake_server.stop()
+    await db_async.close()
+    return report
+
+
+def print_report(report: dict):
+    print(f"backend:          {report['backend']}")
+    print(f"chats/birthdays:  {report['chats']} / {report['birthdays']}")
+    print(f"day plan:         {report['plan_seconds']:.2f} s")
+    print(f"scheduler tick:   {report['tick_seconds'] * 1000:.1f} ms")
+    print(f"queued:           {report['queued_seconds']:.2f} s")
+    print(f"daily send:       {report['send_total_seconds']:.2f} s, {report['delivered']} delivered")
+    print(
+        "delivery spread:  first {delivery_first:.2f}s, p50 {delivery_p50:.2f}s, "
+        "p95 {delivery_p95:.2f}s, last {delivery_last:.2f}s".format(**report)
+    )
+    print(
+        f"telegram:         {report['telegram_requests']} requests, "
+        f"{report['telegram_throttled']} throttled (429)"
+    )
+    print(
+        f"yandex_gpt:       {report['llm_requests']} requests during send, "
+        f"pool {report['greeting_pool_size']} templates"
+    )
+    ops = ", ".join(f"{op}={count}" for op, count in report["db_operations"].items())
+    print(f"db operations:    {ops or '-'}")
+    if report["sql_statements"] is not None:
+        print(f"sql statements:   {report['sql_statements']}")
+    print(f"max rss:          {report['max_rss_mb']} MB")
+    if "tracemalloc_peak_mb" in report:
+        print(f"tracemalloc peak: {report['tracemalloc_peak_mb']} MB")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO if args.verbose else logging.ERROR,
+    )
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmpdir:
+        configure_env(args, tmpdir)
+        import db
+        from config import DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE
+
+        db.init_db(DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
+        seed_started = time.monotonic()
+        seed(args)
+        print(f"seeded in {time.monotonic() - seed_started:.1f} s", file=sys.stderr)
+
+        if args.trace_memory:
+            tracemalloc.start()
+        report = asyncio.run(run(args))
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
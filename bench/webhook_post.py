@@ -0,0 +1,171 @@
+# bench/webhook_post.py
+"""
+Локальная проверка режима webhook: бот в BOT_MODE=webhook против
+заменителя Telegram (bench/fakes.py) и поток апдейтов /start,
+отправленных на WEBHOOK_PATH так, как это делает Telegram.
+
+    python -m bench.webhook_post --updates 500 --concurrency 50
+
+Проверяет, что апдейт с неверным секретом отклоняется, и сообщает
+задержку ответа webhook и время до ответа бота в чат.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+import tempfile
+import time
+
+TOKEN = "1:webhook-bench"
+SECRET = "bench-secret"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--bot-port", type=int, default=18081)
+    parser.add_argument("--fake-port", type=int, default=18082)
+    parser.add_argument("--tg-latency", type=float, default=0.03)
+    parser.add_argument("--timeout", type=float, default=60, help="сколько ждать ответов бота")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def configure_env(args, tmpdir: str):
+    fake = f"http://127.0.0.1:{args.fake_port}"
+    os.environ.update({
+        "BOT_TOKEN": TOKEN,
+        "BOT_MODE": "webhook",
+        "TELEGRAM_API_URL": fake,
+        "WEBHOOK_URL": f"http://127.0.0.1:{args.bot_port}",
+        "WEBHOOK_SECRET": SECRET,
+        "HTTP_HOST": "127.0.0.1",
+        "HTTP_PORT": str(args.bot_port),
+        "DB_BACKEND": "sqlite",
+        "DB_PATH": os.path.join(tmpdir, "webhook.db"),
+        "RUS_CALENDAR_BASE": fake,
+        "HOLIDAYS_CACHE_PATH": "",
+        "YANDEX_API_KEY": "bench",
+        "YANDEX_FOLDER_ID": "bench",
+        "YANDEX_ENDPOINT": f"{fake}/completion",
+    })
+
+
+def make_update(n: int) -> dict:
+    chat_id = -1002000000000 - n
+    return {
+        "update_id": n,
+        "message": {
+            "message_id": n,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": "bench"},
+            "from": {"id": 5000 + n, "is_bot": False, "first_name": "Bench"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args):
+    import bot
+    import httpx
+    from bench.fakes import FakeTelegram, FakeUpstreams
+    from config import WEBHOOK_PATH
+    from http_server import Server
+
+    telegram = FakeTelegram(TOKEN, args.tg_latency, global_rate=10 ** 6, chat_rate_per_min=10 ** 6)
+    fake_server = Server()
+    telegram.install(fake_server)
+    FakeUpstreams(0.0, 0.0, 0.0).install(fake_server)
+    await fake_server.start("127.0.0.1", args.fake_port)
+
+    app = bot.build_application()
+    bot_task = asyncio.create_task(bot.run_service(app, use_webhook=True))
+    url = f"http://127.0.0.1:{args.bot_port}{WEBHOOK_PATH}"
+
+    async with httpx.AsyncClient() as client:
+        # Ждём, пока бот поднимет сервер и зарегистрирует webhook
+        while telegram.webhook is None:
+            if bot_task.done():
+                bot_task.result()
+            await asyncio.sleep(0.05)
+
+        resp = await client.post(
+            url, json=make_update(0), headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}
+        )
+        rejected = resp.status_code == 403
+
+        posted_at: dict[int, float] = {}
+        post_latency: list[float] = []
+        statuses: dict[int, int] = {}
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def post(n: int):
+            update = make_update(n)
+            async with limit:
+                started = time.monotonic()
+                resp = await client.post(
+                    url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+                )
+                post_latency.append(time.monotonic() - started)
+            posted_at[update["message"]["chat"]["id"]] = started
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(post(n) for n in range(1, args.updates + 1)))
+        post_seconds = time.monotonic() - started
+
+        deadline = time.monotonic() + args.timeout
+        while len(telegram.sent) < args.updates and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        total_seconds = time.monotonic() - started
+
+    os.kill(os.getpid(), signal.SIGTERM)
+    await bot_task
+    await fake_server.stop()
+
+    replies = [t - posted_at[chat_id] for chat_id, t in telegram.sent if chat_id in posted_at]
+    print(f"wrong secret rejected: {'yes' if rejected else 'NO'}")
+    print(f"webhook responses:     {dict(sorted(statuses.items()))}")
+    print(
+        f"webhook latency:       p50 {percentile(post_latency, 0.5) * 1000:.1f} ms, "
+        f"p95 {percentile(post_latency, 0.95) * 1000:.1f} ms"
+    )
+    print(f"accepted:              {args.updates / post_seconds:.0f} updates/s")
+    print(
+        f"bot replies:           {len(replies)}/{args.updates} in {total_seconds:.2f} s, "
+        f"p50 {percentile(replies, 0.5) * 1000:.0f} ms, p95 {percentile(replies, 0.95) * 1000:.0f} ms"
+    )
+    return rejected and len(replies) == args.updates
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO if args.verbose else logging.ERROR,
+    )
+    with tempfile.TemporaryDirectory(prefix="webhook-") as tmpdir:
+        configure_env(args, tmpdir)
+        import db
+        import schedule
+        from config import DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE
+
+        db.init_db(DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
+        schedule.load(db.get_chat_slots())
+        ok = asyncio.run(run(args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
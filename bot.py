@@ -1,13 +1,36 @@
 # bot.py
+import asyncio
+import json
 import logging
 import os
+import signal
+from datetime import datetime, time, timezone
 
+from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
+    CallbackQueryHandler,
+    ChatMemberHandler,
     CommandHandler,
     JobQueue,
+    MessageHandler,
+    TypeHandler,
+    filters,
 )
 
+import schedule
+import scheduler
+import db_async
+import http_client
+import http_server
+import listing
+import metrics
+import outbox
+import profiler
+import resilience
+import sharding
+import tracing
+import webhook
 from db import init_db
 from handlers import (
     start,
@@ -16,14 +39,48 @@ from handlers import (
     list_my_bdays_cmd,
     del_my_bday_cmd,
     list_bdays_cmd,
+    list_page_callback,
     del_bday_cmd,
+    import_cmd,
+    export_cmd,
     enable_cmd,
     disable_cmd,
     time_cmd,
+    tz_cmd,
     scheduler_tick,
+    pregenerate_job,
+    day_plan_job,
+    greeting_pool_job,
+    warm_greeting_pool_job,
+    refresh_holidays_job,
+    refresh_timezones_job,
+    warm_holidays_job,
+    cleanup_greetings_job,
+    heartbeat_job,
+    load_schedule,
+    sync_schedule_job,
     debug_holidays_cmd,
+    debug_upstreams_cmd,
+    profile_cmd,
+    chat_member_update,
     )
-from config import BOT_TOKEN
+from config import (
+    BOT_MODE,
+    BOT_TOKEN,
+    CONCURRENT_UPDATES,
+    DEFAULT_JOB_HOUR,
+    DEFAULT_JOB_MINUTE,
+    HTTP_HOST,
+    HEARTBEAT_INTERVAL,
+    HTTP_PORT,
+    PROFILE_SECONDS,
+    SCHEDULE_SYNC_INTERVAL,
+    TELEGRAM_API_URL,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    WORKER_COUNT,
+    WORKER_ID,
+)
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -32,29 +89,156 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+async def metrics_endpoint(request):
+    return http_server.Response(
+        body=metrics.render().encode(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+async def health_endpoint(request):
+    next_fire = schedule.next_fire()
+    body = {
+        "status": "ok",
+        "next_send": next_fire.isoformat() if next_fire else None,
+        "upstreams": resilience.snapshot(),
+        "outbox": await outbox.backlog(),
+    }
+    return http_server.Response(
+        body=json.dumps(body).encode(), content_type="application/json"
+    )
+
+
 async def on_startup(app):
+    if HTTP_PORT:
+        http_server.add_route("GET", "/metrics", metrics_endpoint)
+        http_server.add_route("GET", "/health", health_endpoint)
+        if BOT_MODE == "webhook":
+            webhook.install(app)
+        await http_server.start(HTTP_HOST, HTTP_PORT)
+
+    # Досылаем то, что осталось в очереди с прошлого запуска
+    outbox.start(app.bot)
+
+    # kill -USR1 <pid>: профиль на PROFILE_SECONDS секунд в PROFILE_DIR
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1, profiler.start_in_background, PROFILE_SECONDS
+        )
+
     job_queue: JobQueue = app.job_queue
+    scheduler.start(job_queue, scheduler_tick)
+
+    # План на сутки строится по дате UTC; дни, которых в нём нет (например,
+    # досылка сразу после старта), рассылка читает из базы
+    job_queue.run_once(day_plan_job, when=0, name="warm_day_plan")
+    job_queue.run_daily(
+        day_plan_job, time=time(0, 0, tzinfo=timezone.utc), name="day_plan"
+    )
+
+    if sharding.enabled():
+        logger.info("Worker %d of %d.", WORKER_ID, WORKER_COUNT)
+        job_queue.run_repeating(
+            heartbeat_job, interval=HEARTBEAT_INTERVAL, first=0, name="heartbeat"
+        )
+        job_queue.run_repeating(
+            sync_schedule_job,
+            interval=SCHEDULE_SYNC_INTERVAL,
+            first=SCHEDULE_SYNC_INTERVAL,
+            name="sync_schedule",
+        )
+    logger.info("Scheduler started, next daily send at %s.", schedule.next_fire())
+
+    # Пул шаблонов нужен до заблаговременной генерации поздравлений
+    job_queue.run_once(warm_greeting_pool_job, when=0, name="warm_greeting_pool")
     job_queue.run_repeating(
-        scheduler_tick,
-        interval=60,
-        first=10,
-        name="scheduler_tick",
+        greeting_pool_job,
+        interval=24 * 60 * 60,
+        first=24 * 60 * 60,
+        name="greeting_pool",
     )
-    logger.info("Scheduler job started (every 60s).")
 
+    job_queue.run_repeating(
+        pregenerate_job,
+        interval=60 * 60,
+        first=5,
+        name="pregenerate_greetings",
+    )
 
-def main():
-    if not BOT_TOKEN:
-        raise RuntimeError("Не задан BOT_TOKEN в переменных окружения.")
+    job_queue.run_repeating(
+        refresh_timezones_job,
+        interval=60 * 60,
+        first=60,
+        name="refresh_timezones",
+    )
 
-    init_db()
+    job_queue.run_once(warm_holidays_job, when=0, name="warm_holidays")
+    job_queue.run_daily(
+        refresh_holidays_job,
+        time=time(0, 0, 30, tzinfo=datetime.now().astimezone().tzinfo),
+        name="refresh_holidays",
+    )
+    job_queue.run_daily(
+        cleanup_greetings_job,
+        time=time(0, 5, tzinfo=datetime.now().astimezone().tzinfo),
+        name="cleanup_greetings",
+    )
+
+
+async def on_stop(app):
+    # Бот ещё не закрыт: текущая пачка outbox успеет доотправиться
+    await outbox.stop()
+
+
+async def on_shutdown(app):
+    await http_server.stop()
+    await http_client.close()
+    await db_async.close()
 
-    app = (
+
+async def run_service(app, use_webhook: bool):
+    """
+    Жизненный цикл приложения без long polling: в режиме webhook
+    (run_webhook из python-telegram-bot поднимает свой сервер, а нам нужен
+    общий с /metrics и /health) и у воркеров, которые только рассылают.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await app.initialize()
+    try:
+        await on_startup(app)
+        await app.start()
+        if use_webhook:
+            await webhook.register(app, Update.ALL_TYPES)
+        await stop.wait()
+        await app.stop()
+        await on_stop(app)
+    finally:
+        await on_shutdown(app)
+        await app.shutdown()
+
+
+def build_application():
+    builder = (
         ApplicationBuilder()
         .token(BOT_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        # Запросы к Bot API попадают в трассу апдейта (см. tracing.py)
+        .request(tracing.TracedRequest(connection_pool_size=256))
         .post_init(on_startup)
-        .build()
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
     )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot")
+    app = builder.build()
+
+    # Трасса апдейта открывается до всех обработчиков и закрывается после них
+    app.add_handler(TypeHandler(Update, tracing.begin), group=tracing.TRACE_BEGIN_GROUP)
+    app.add_handler(TypeHandler(Update, tracing.finish), group=tracing.TRACE_END_GROUP)
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("add", add_chat_cmd))
@@ -62,13 +246,55 @@ def main():
     app.add_handler(CommandHandler("list_my_bdays", list_my_bdays_cmd))
     app.add_handler(CommandHandler("del_my_bday", del_my_bday_cmd))
     app.add_handler(CommandHandler("list_bdays", list_bdays_cmd))
+    app.add_handler(
+        CallbackQueryHandler(list_page_callback, pattern=rf"^{listing.CALLBACK_PREFIX}:")
+    )
     app.add_handler(CommandHandler("del_bday", del_bday_cmd))
+    app.add_handler(CommandHandler("import", import_cmd))
+    # Файл с подписью /import: подпись CommandHandler не видит
+    app.add_handler(
+        MessageHandler(
+            filters.Document.ALL & filters.CaptionRegex(r"^/import(@\w+)?(\s|$)"), import_cmd
+        )
+    )
+    app.add_handler(CommandHandler("export", export_cmd))
     app.add_handler(CommandHandler("enable", enable_cmd))
     app.add_handler(CommandHandler("disable", disable_cmd))
     app.add_handler(CommandHandler("time", time_cmd))
+    app.add_handler(CommandHandler("tz", tz_cmd))
     app.add_handler(CommandHandler("debug_holidays", debug_holidays_cmd))
-    logger.info("Bot starting...")
-    app.run_polling()
+    app.add_handler(CommandHandler("debug_upstreams", debug_upstreams_cmd))
+    app.add_handler(CommandHandler("profile", profile_cmd))
+    app.add_handler(
+        ChatMemberHandler(chat_member_update, ChatMemberHandler.ANY_CHAT_MEMBER)
+    )
+    return app
+
+
+def main():
+    if not BOT_TOKEN:
+        raise RuntimeError("Не задан BOT_TOKEN в переменных окружения.")
+    if BOT_MODE not in ("polling", "webhook"):
+        raise RuntimeError(f"Неизвестный BOT_MODE: {BOT_MODE}")
+    if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET and HTTP_PORT):
+        raise RuntimeError("Для BOT_MODE=webhook нужны WEBHOOK_URL, WEBHOOK_SECRET и HTTP_PORT.")
+    if not 0 <= WORKER_ID < WORKER_COUNT:
+        raise RuntimeError(f"WORKER_ID должен быть от 0 до {WORKER_COUNT - 1}.")
+
+    init_db(DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
+    load_schedule()
+
+    app = build_application()
+    logger.info("Bot starting in %s mode...", BOT_MODE)
+    if BOT_MODE == "webhook":
+        asyncio.run(run_service(app, use_webhook=True))
+        return
+    if not sharding.receives_updates():
+        logger.info("Updates are polled by worker 0, this worker only sends.")
+        asyncio.run(run_service(app, use_webhook=False))
+        return
+    # chat_member приходят только если явно запрошены
+    app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     main()
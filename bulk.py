@@ -0,0 +1,192 @@
+# bulk.py
+"""
+Загрузка и выгрузка дней рождения чата файлом (/import и /export).
+
+Форматы:
+- CSV: колонки date (DD.MM), name и необязательная user_id; строка
+  заголовка необязательна, разделитель — запятая или точка с запятой;
+- JSON: массив объектов {"date": "DD.MM", "name": ..., "user_id": ...}
+  или JSON Lines — по объекту в строке.
+
+Файл разбирается построчно (кроме JSON-массива, размер которого
+ограничен IMPORT_MAX_BYTES); выгрузка читает базу страницами по
+EXPORT_PAGE_SIZE записей и пишет во временный файл, поэтому большой
+чат не поднимается в память целиком.
+"""
+import csv
+import io
+import json
+import tempfile
+from datetime import date
+
+from config import EXPORT_PAGE_SIZE, IMPORT_MAX_ROWS
+from db_async import list_birthdays_page
+from storage import month_day
+
+# Сколько ошибок показывать в ответе на /import
+_MAX_ERRORS = 10
+# Сколько выгрузки держать в памяти до сброса во временный файл
+_SPOOL_BYTES = 256 * 1024
+
+
+class InvalidFile(Exception):
+    """Файл не загружен; текст исключения — для пользователя."""
+
+
+def parse_day_month(text: str) -> str | None:
+    """"DD.MM" -> "2000-MM-DD" (2000 — високосный, 29.02 допустимо) или None."""
+    try:
+        day, month = map(int, text.strip().split("."))
+        return date(2000, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _format_day_month(date_str: str) -> str:
+    _, m, d = date_str.split("-")
+    return f"{d}.{m}"
+
+
+def _parse_record(fields: dict) -> tuple[str, str, int | None]:
+    """(имя, дата YYYY-MM-DD, user_id или None); ValueError с текстом для пользователя."""
+    raw_date = str(fields.get("date") or "")
+    date_str = parse_day_month(raw_date)
+    if date_str is None:
+        raise ValueError(f"неверная дата «{raw_date}», нужно DD.MM")
+    name = str(fields.get("name") or "").strip()
+    if not name:
+        raise ValueError("пустое имя")
+    raw_user = fields.get("user_id")
+    if raw_user in (None, ""):
+        return name, date_str, None
+    error = ValueError(f"user_id должен быть целым числом, а не «{raw_user}»")
+    # int() принял бы и true из JSON, и дробное число, отбросив дробную часть
+    if isinstance(raw_user, bool) or (isinstance(raw_user, float) and not raw_user.is_integer()):
+        raise error
+    try:
+        return name, date_str, int(raw_user)
+    except (TypeError, ValueError):
+        raise error
+
+
+def _csv_records(text: io.TextIOBase):
+    """(номер строки, поля) из CSV; заголовок распознаётся по имени колонки date."""
+    skipped, first = _skip_blank(text)
+    delimiter = ";" if first.count(";") > first.count(",") else ","
+    lines = csv.reader(_chain(first, text), delimiter=delimiter)
+    columns = ["date", "name", "user_id"]
+    header_checked = False
+    for line_no, values in enumerate(lines, start=skipped + 1):
+        values = [value.strip() for value in values]
+        if not any(values):
+            continue
+        if not header_checked:
+            header_checked = True
+            if "date" in (value.lower() for value in values):
+                columns = [value.lower() for value in values]
+                continue
+        yield line_no, dict(zip(columns, values))
+
+
+def _skip_blank(text: io.TextIOBase) -> tuple[int, str]:
+    """Пропускает пустые строки в начале: (сколько пропущено, первая непустая строка)."""
+    skipped = 0
+    line = text.readline()
+    while line and not line.strip():
+        skipped += 1
+        line = text.readline()
+    return skipped, line
+
+
+def _chain(first: str, rest):
+    yield first
+    yield from rest
+
+
+def _json_records(text: io.TextIOBase):
+    """(номер записи, поля) из JSON-массива или JSON Lines."""
+    skipped, first = _skip_blank(text)
+    if first.lstrip().startswith("["):
+        items = json.loads(first + text.read())
+        yield from enumerate(items, start=1)
+        return
+    for line_no, line in enumerate(_chain(first, text), start=skipped + 1):
+        if line.strip():
+            yield line_no, json.loads(line)
+
+
+def parse_import(data: bytes, filename: str) -> list[tuple[str, str, int | None]]:
+    """
+    Записи файла для import_birthdays. Формат определяется по расширению
+    (.json/.jsonl, иначе CSV). Бросает InvalidFile с описанием ошибок:
+    файл загружается только целиком.
+    """
+    text = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")
+    is_json = filename.lower().endswith((".json", ".jsonl"))
+    records = _json_records(text) if is_json else _csv_records(text)
+
+    rows, errors = [], []
+    try:
+        for number, fields in records:
+            if len(rows) >= IMPORT_MAX_ROWS:
+                raise InvalidFile(f"Слишком много записей: не больше {IMPORT_MAX_ROWS} за раз.")
+            if not isinstance(fields, dict):
+                errors.append(f"запись {number}: нужен объект с полями date и name")
+                continue
+            try:
+                rows.append(_parse_record(fields))
+            except ValueError as e:
+                errors.append(f"строка {number}: {e}")
+            if len(errors) >= _MAX_ERRORS:
+                break
+    except UnicodeDecodeError:
+        raise InvalidFile("Файл должен быть в кодировке UTF-8.")
+    except (json.JSONDecodeError, csv.Error) as e:
+        raise InvalidFile(f"Не удалось разобрать файл: {e}")
+
+    if errors:
+        raise InvalidFile("Файл не загружен, исправь ошибки:\n" + "\n".join(errors))
+    if not rows:
+        raise InvalidFile("В файле нет записей.")
+    return rows
+
+
+async def iter_birthdays(chat_id: int):
+    """Все записи чата (id, user_id, name, date) по страницам, в порядке list_birthdays."""
+    after_md, after_id = 0, 0
+    while True:
+        page = await list_birthdays_page(chat_id, after_md, after_id, EXPORT_PAGE_SIZE)
+        for row in page:
+            yield row
+        if len(page) < EXPORT_PAGE_SIZE:
+            return
+        rec_id, _, _, date_str = page[-1]
+        _, m, d = date_str.split("-")
+        after_md, after_id = month_day(int(m), int(d)), rec_id
+
+
+async def export_file(chat_id: int, fmt: str):
+    """
+    Выгрузка чата в формате fmt (csv или json). Возвращает (файл,
+    открытый на начале, число записей); файл закрывает вызывающий.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=_SPOOL_BYTES)
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    count = 0
+    if fmt == "json":
+        text.write("[")
+        async for rec_id, user_id, name, date_str in iter_birthdays(chat_id):
+            item = {"id": rec_id, "user_id": user_id, "name": name, "date": _format_day_month(date_str)}
+            text.write(("," if count else "") + "\n  " + json.dumps(item, ensure_ascii=False))
+            count += 1
+        text.write("\n]\n")
+    else:
+        writer = csv.writer(text)
+        writer.writerow(["id", "user_id", "name", "date"])
+        async for rec_id, user_id, name, date_str in iter_birthdays(chat_id):
+            writer.writerow([rec_id, user_id, name, _format_day_month(date_str)])
+            count += 1
+    # Отсоединяем обёртку, чтобы её закрытие не закрыло сам файл
+    text.detach()
+    out.seek(0)
+    return out, count
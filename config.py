@@ -5,8 +5,17 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Свой Bot API сервер или локальный заменитель (по умолчанию api.telegram.org)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
 
-DB_PATH = os.getenv("DB_PATH", "birthdays.db")
+# Хранилище: sqlite (файл в постоянном хранилище Amvera) или postgres
+DB_BACKEND = os.getenv("DB_BACKEND", "sqlite")
+DB_PATH = os.getenv("DB_PATH", "/data/birthdays.db")
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+# Сколько известных чатов помнить, чтобы не повторять register_chat
+KNOWN_CHATS_MAX = int(os.getenv("KNOWN_CHATS_MAX", "100000"))
 
 RUS_CALENDAR_BASE = os.getenv(
     "RUS_CALENDAR_BASE",
@@ -26,3 +35,97 @@ YANDEX_MODEL = os.getenv(
 
 DEFAULT_JOB_HOUR = int(os.getenv("JOB_HOUR", "9"))
 DEFAULT_JOB_MINUTE = int(os.getenv("JOB_MINUTE", "0"))
+# Пояс чатов без /tz (имя IANA, например Europe/Moscow); пусто — пояс сервера
+DEFAULT_TZ = os.getenv("DEFAULT_TZ") or None
+
+# Кэш календаря праздников (пустая строка — не сохранять на диск)
+HOLIDAYS_CACHE_PATH = os.getenv("HOLIDAYS_CACHE_PATH", "/data/holidays.json")
+HOLIDAYS_TTL = int(os.getenv("HOLIDAYS_TTL", str(24 * 60 * 60)))
+
+# Пул исходящих HTTP-соединений к внешним API
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "8"))
+
+# Внешние API: сбоев подряд до размыкания предохранителя, пауза до пробного
+# запроса и число попыток на вызов
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "5"))
+UPSTREAM_RESET_SECONDS = float(os.getenv("UPSTREAM_RESET_SECONDS", "30"))
+UPSTREAM_MAX_ATTEMPTS = int(os.getenv("UPSTREAM_MAX_ATTEMPTS", "2"))
+
+# Рассылка: число воркеров и лимиты Telegram Bot API
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", "16"))
+SEND_MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "4"))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_GLOBAL_BURST = float(os.getenv("TELEGRAM_GLOBAL_BURST", "1"))
+TELEGRAM_CHAT_RATE_PER_MIN = float(os.getenv("TELEGRAM_CHAT_RATE_PER_MIN", "20"))
+
+# Поздравления YandexGPT: параллельность и заблаговременная генерация
+GREETING_CONCURRENCY = int(os.getenv("GREETING_CONCURRENCY", "4"))
+GREETING_LEAD_MINUTES = int(os.getenv("GREETING_LEAD_MINUTES", "180"))
+# Пул шаблонов поздравлений: сколько хранить и сколько новых генерировать за раз
+GREETING_POOL_SIZE = int(os.getenv("GREETING_POOL_SIZE", "100"))
+GREETING_POOL_BATCH = int(os.getenv("GREETING_POOL_BATCH", "10"))
+
+# Владельцы бота (id пользователей через запятую): служебные команды вроде /profile
+ADMIN_USER_IDS = {
+    int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").replace(" ", "").split(",") if user_id
+}
+
+# Кэш администраторов чатов
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "300"))
+ADMIN_CACHE_SIZE = int(os.getenv("ADMIN_CACHE_SIZE", "1000"))
+
+# Служебный HTTP-сервер (/metrics, /health) на containerPort из amvera.yml; 0 — выключен
+HTTP_HOST = os.getenv("HTTP_HOST", "0.0.0.0")
+HTTP_PORT = int(os.getenv("HTTP_PORT", "80"))
+
+# Получение апдейтов: polling или webhook (на том же HTTP-сервере, что /metrics).
+# WEBHOOK_URL — публичный адрес сервиса без пути, WEBHOOK_SECRET — секрет
+# из заголовка X-Telegram-Bot-Api-Secret-Token
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Сколько апдейтов обрабатывать одновременно
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+
+# Несколько воркеров с общей базой: WORKER_ID от 0 до WORKER_COUNT - 1.
+# Каждый рассылает свою часть чатов; чаты упавшего воркера через
+# SEND_FAILOVER_DELAY секунд забирают остальные
+WORKER_ID = int(os.getenv("WORKER_ID", "0"))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "1"))
+HEARTBEAT_INTERVAL = int(os.getenv("HEARTBEAT_INTERVAL", "30"))
+WORKER_TIMEOUT = int(os.getenv("WORKER_TIMEOUT", "90"))
+SEND_LEASE_SECONDS = int(os.getenv("SEND_LEASE_SECONDS", "600"))
+SEND_FAILOVER_DELAY = int(os.getenv("SEND_FAILOVER_DELAY", "120"))
+SCHEDULE_SYNC_INTERVAL = int(os.getenv("SCHEDULE_SYNC_INTERVAL", "60"))
+
+# Очередь готовых сообщений (outbox): размер пачки, аренда пачки воркером,
+# попытки доставки с паузой от OUTBOX_RETRY_SECONDS (удваивается) и как часто
+# проверять очередь без сигнала о новых сообщениях
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "50"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_SECONDS = float(os.getenv("OUTBOX_RETRY_SECONDS", "30"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "30"))
+
+# Повтор рассылки чату, чьё сообщение не удалось подготовить (сбой базы или
+# генерации): пауза от DAILY_RETRY_SECONDS (удваивается), не больше
+# DAILY_RETRY_ATTEMPTS попыток, пока у чата не кончились те сутки
+DAILY_RETRY_SECONDS = float(os.getenv("DAILY_RETRY_SECONDS", "30"))
+DAILY_RETRY_ATTEMPTS = int(os.getenv("DAILY_RETRY_ATTEMPTS", "8"))
+
+# /import и /export: предел размера файла и числа записей, размер страницы выгрузки
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(1024 * 1024)))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "5000"))
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+
+# /list_bdays и /list_my_bdays: записей на странице
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "20"))
+
+# Трассировка апдейтов: с какой длительности писать апдейт в лог с разбивкой
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "1"))
+# Профилировщик (/profile, SIGUSR1): куда писать, шаг выборки, длительность по сигналу
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/data/profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))
+PROFILE_SECONDS = int(os.getenv("PROFILE_SECONDS", "30"))
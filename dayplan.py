@@ -0,0 +1,167 @@
+# dayplan.py
+"""
+План ежедневной рассылки на сутки.
+
+Раз в сутки, после полуночи по UTC (и при старте), build одним запросом
+читает дни рождения всех чатов на даты, которые за эти сутки могут
+наступить хоть в каком-нибудь поясе, и раскладывает их в индекс
+месяц-день -> чат -> записи. Какие чаты рассылать в данную минуту,
+знает schedule (минута UTC -> чаты, с учётом /time и /tz); записи к ним
+на местную дату чата отдаёт birthdays_for — без запросов к базе.
+
+/bday, /del_bday, /del_my_bday и /import правят план точечно: refresh
+перечитывает записи одного чата, remove убирает запись по id. Правки,
+сделанные через другие воркеры, приходят с синхронизацией расписания
+(refresh_chats для изменённых чатов). Дата вне плана (план ещё не
+построен или не удалось его построить) читается из базы, как раньше.
+"""
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from db_async import get_birthdays_for_chats, get_birthdays_for_day, get_birthdays_for_days
+from storage import month_day
+
+logger = logging.getLogger(__name__)
+
+# Дни плана относительно даты по UTC: пояса от UTC-12 до UTC+14 и запас
+# на заблаговременную генерацию поздравлений (GREETING_LEAD_MINUTES)
+_DAYS = range(-1, 3)
+
+# md -> chat_id -> [(id, user_id, name, date), ...] по id. Списки
+# не меняются на месте, а заменяются: выданные наружу остаются целыми
+_index: dict[int, dict[int, list[tuple]]] = {}
+# md -> дата, на которую построен план
+_days: dict[int, date] = {}
+# Чаты, изменённые во время build: перечитываются после замены плана
+_changed: set[int] | None = None
+
+
+def days() -> list[date]:
+    """Даты, на которые построен план."""
+    return sorted(_days.values())
+
+
+def covers(day: date) -> bool:
+    return _days.get(month_day(day.month, day.day)) == day
+
+
+def birthdays_for(chat_ids, day: date) -> dict[int, list] | None:
+    """
+    То же, что db.get_birthdays_for_chats, из плана: chat_id -> записи
+    на day только для чатов с записями. None — дня нет в плане.
+    """
+    if not covers(day):
+        return None
+    by_chat = _index[month_day(day.month, day.day)]
+    return {chat_id: by_chat[chat_id] for chat_id in chat_ids if chat_id in by_chat}
+
+
+async def get_birthdays(chat_ids, day: date) -> dict[int, list]:
+    """birthdays_for, а для дня вне плана — запрос к базе."""
+    planned = birthdays_for(chat_ids, day)
+    if planned is not None:
+        return planned
+    return await get_birthdays_for_chats(chat_ids, day.month, day.day)
+
+
+async def build(now: datetime | None = None) -> tuple[int, int] | None:
+    """
+    Строит план на сутки по UTC-дате момента now (по умолчанию сейчас).
+    Возвращает (чатов, записей) или None, если план уже строится.
+    """
+    global _index, _days, _changed
+    if _changed is not None:
+        return None
+    now = now or datetime.now(timezone.utc)
+    today = now.date()
+    plan_days = {}
+    for shift in _DAYS:
+        day = today + timedelta(days=shift)
+        plan_days[month_day(day.month, day.day)] = day
+
+    started = time.monotonic()
+    _changed = set()
+    try:
+        rows = await get_birthdays_for_days(plan_days)
+        index: dict[int, dict[int, list[tuple]]] = {md: {} for md in plan_days}
+        chats = set()
+        for chat_id, md, rec_id, user_id, name, date_str in rows:
+            index[md].setdefault(chat_id, []).append((rec_id, user_id, name, date_str))
+            chats.add(chat_id)
+        _index, _days = index, plan_days
+    finally:
+        changed, _changed = _changed, None
+
+    # Правки, сделанные во время запроса, могли в него не попасть
+    await refresh_chats(changed)
+    logger.debug(
+        "Day plan %s..%s: %d birthdays in %d chats in %.2fs",
+        min(plan_days.values()), max(plan_days.values()),
+        len(rows), len(chats), time.monotonic() - started,
+    )
+    return len(chats), len(rows)
+
+
+def _touch(chat_id: int):
+    if _changed is not None:
+        _changed.add(chat_id)
+
+
+async def refresh(chat_id: int, date_str: str | None = None):
+    """
+    Перечитывает записи чата в плане после изменения: только на дату
+    date_str (YYYY-MM-DD новой записи) или на все дни плана.
+    """
+    if date_str is None:
+        await refresh_chats((chat_id,))
+        return
+    _touch(chat_id)
+    _, m, d = date_str.split("-")
+    md = month_day(int(m), int(d))
+    if md not in _days:
+        return
+    rows = await get_birthdays_for_day(chat_id, int(m), int(d))
+    # План мог смениться, пока шёл запрос
+    by_chat = _index.get(md)
+    if by_chat is None:
+        return
+    if rows:
+        by_chat[chat_id] = rows
+    else:
+        by_chat.pop(chat_id, None)
+
+
+async def refresh_chats(chat_ids):
+    """Перечитывает записи чатов на все дни плана: по запросу на день."""
+    chat_ids = list(chat_ids)
+    if not chat_ids:
+        return
+    for chat_id in chat_ids:
+        _touch(chat_id)
+    for md, day in list(_days.items()):
+        found = await get_birthdays_for_chats(chat_ids, day.month, day.day)
+        by_chat = _index.get(md)
+        if by_chat is None:
+            continue
+        for chat_id in chat_ids:
+            if chat_id in found:
+                by_chat[chat_id] = found[chat_id]
+            else:
+                by_chat.pop(chat_id, None)
+
+
+def remove(chat_id: int, rec_id: int):
+    """Убирает удалённую запись из плана."""
+    _touch(chat_id)
+    for by_chat in _index.values():
+        rows = by_chat.get(chat_id)
+        if not rows:
+            continue
+        kept = [row for row in rows if row[0] != rec_id]
+        if len(kept) == len(rows):
+            continue
+        if kept:
+            by_chat[chat_id] = kept
+        else:
+            del by_chat[chat_id]
@@ -1,191 +1,312 @@
 # db.py
-import sqlite3
-from datetime import datetime
-
-DB_PATH = "/data/birthdays.db"
-
-def get_conn():
-    """SQLite в постоянном хранилище Amvera"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS birthdays (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            chat_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            date TEXT NOT NULL
-        );
-        """
-    )
+"""
+Доступ к хранилищу дней рождения и чатов.
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS chats (
-            chat_id INTEGER PRIMARY KEY,
-            enabled INTEGER NOT NULL DEFAULT 1,
-            hour INTEGER,
-            minute INTEGER
-        );
-        """
-    )
+Функции модуля — контракт хранилища; реализация (SQLite или PostgreSQL)
+выбирается конфигурацией DB_BACKEND в init_db. Для тестов можно
+подставить своё хранилище через set_storage.
+"""
+import functools
+import time
 
-    conn.commit()
-    conn.close()
+from config import DB_BACKEND, DB_PATH, DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, KNOWN_CHATS_MAX
+from metrics import DB_ERRORS, DB_SECONDS
+from storage import Storage
 
+_storage: Storage | None = None
+
+# Чаты, которые точно есть в таблице chats: register_chat для них не пишет
+# в базу. Чаты не удаляются, поэтому запись не устаревает; сверх
+# KNOWN_CHATS_MAX новые не запоминаем (промах — лишь INSERT без эффекта)
+_known_chats: set[int] = set()
+
+
+def create_storage() -> Storage:
+    if DB_BACKEND == "sqlite":
+        from storage_sqlite import SQLiteStorage
+        return SQLiteStorage(DB_PATH)
+    if DB_BACKEND == "postgres":
+        if not DATABASE_URL:
+            raise RuntimeError("Для DB_BACKEND=postgres нужен DATABASE_URL.")
+        from storage_postgres import PostgresStorage
+        return PostgresStorage(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX)
+    raise RuntimeError(f"Неизвестный DB_BACKEND: {DB_BACKEND}")
+
+
+def set_storage(storage: Storage | None):
+    global _storage
+    _storage = storage
+    _known_chats.clear()
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
+
+
+def init_db(default_hour: int, default_minute: int):
+    get_storage().migrate(default_hour, default_minute)
+
+
+def close_db():
+    global _storage
+    if _storage is not None:
+        _storage.close()
+        _storage = None
+    _known_chats.clear()
+
+
+def _timed(fn):
+    """Длительность и ошибки операции в метриках bot_db_*."""
+    # Внутренние _register_chat и т.п. пишутся под именем публичной функции
+    op = fn.__name__.lstrip("_")
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(op)
+            raise
+        finally:
+            DB_SECONDS.observe(op, value=time.perf_counter() - started)
+    return wrapper
+
+
+def transaction():
+    """Несколько вызовов функций модуля с одним COMMIT."""
+    return get_storage().transaction()
+
+
+def remember_chats(chat_ids):
+    """Прогрев кэша известных чатов (при старте — из тех же строк, что и расписание)."""
+    for chat_id in chat_ids:
+        if len(_known_chats) >= KNOWN_CHATS_MAX:
+            break
+        _known_chats.add(chat_id)
+
+
+def is_known_chat(chat_id: int) -> bool:
+    return chat_id in _known_chats
 
-def register_chat(chat_id: int, default_hour: int, default_minute: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT OR IGNORE INTO chats (chat_id, enabled, hour, minute)
-        VALUES (?, 1, ?, ?)
-        """,
-        (chat_id, default_hour, default_minute),
-    )
-    conn.commit()
-    conn.close()
+
+@_timed
+def _register_chat(chat_id: int, default_hour: int, default_minute: int) -> bool:
+    storage = get_storage()
+    with storage.transaction():
+        created = storage.register_chat(chat_id, default_hour, default_minute)
+        # Запоминаем только после COMMIT: откат транзакции чат не добавит
+        storage.on_commit(lambda: remember_chats((chat_id,)))
+    return created
+
+
+def register_chat(chat_id: int, default_hour: int, default_minute: int) -> bool:
+    """True, если чат добавлен этим вызовом. Известный чат не трогает базу."""
+    if chat_id in _known_chats:
+        return False
+    return _register_chat(chat_id, default_hour, default_minute)
+
+
+@_timed
+def _chat_exists(chat_id: int) -> bool:
+    exists = get_storage().chat_exists(chat_id)
+    if exists:
+        remember_chats((chat_id,))
+    return exists
 
 
 def chat_exists(chat_id: int) -> bool:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM chats WHERE chat_id = ? LIMIT 1", (chat_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row is not None
+    return chat_id in _known_chats or _chat_exists(chat_id)
 
 
+@_timed
 def set_chat_enabled(chat_id: int, enabled: bool):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE chats SET enabled = ? WHERE chat_id = ?",
-        (1 if enabled else 0, chat_id),
-    )
-    conn.commit()
-    conn.close()
+    return get_storage().set_chat_enabled(chat_id, enabled)
 
 
+@_timed
 def set_chat_time(chat_id: int, hour: int, minute: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE chats SET hour = ?, minute = ? WHERE chat_id = ?",
-        (hour, minute, chat_id),
-    )
-    conn.commit()
-    conn.close()
+    return get_storage().set_chat_time(chat_id, hour, minute)
+
+
+@_timed
+def get_chat_tz(chat_id: int) -> str | None:
+    return get_storage().get_chat_tz(chat_id)
+
+
+@_timed
+def set_chat_tz(chat_id: int, tz_name: str | None):
+    return get_storage().set_chat_tz(chat_id, tz_name)
+
+
+@_timed
+def refresh_utc_offsets() -> bool:
+    return get_storage().refresh_utc_offsets()
+
+
+@_timed
+def get_chat_slots():
+    return get_storage().get_chat_slots()
+
+
+@_timed
+def get_chat_slots_changed_since(since: float):
+    return get_storage().get_chat_slots_changed_since(since)
+
+
+@_timed
+def mark_sent(chat_id: int, day: str):
+    return get_storage().mark_sent(chat_id, day)
+
+
+@_timed
+def heartbeat(worker_id: int, now: float):
+    return get_storage().heartbeat(worker_id, now)
+
 
+@_timed
+def get_live_workers(since: float) -> list[int]:
+    return get_storage().get_live_workers(since)
 
+
+@_timed
+def claim_sends(chat_ids, day: str, worker_id: int, now: float, lease_seconds: float):
+    return get_storage().claim_sends(chat_ids, day, worker_id, now, lease_seconds)
+
+
+@_timed
+def get_unsent_chats(chat_ids, day: str) -> list[int]:
+    return get_storage().get_unsent_chats(chat_ids, day)
+
+
+@_timed
+def delete_send_leases_before(day: str):
+    return get_storage().delete_send_leases_before(day)
+
+
+@_timed
+def enqueue_outbox(items, now: float):
+    return get_storage().enqueue_outbox(items, now)
+
+
+@_timed
+def claim_outbox(worker_id: int, now: float, lease_seconds: float, limit: int):
+    return get_storage().claim_outbox(worker_id, now, lease_seconds, limit)
+
+
+@_timed
+def release_outbox(worker_id: int):
+    return get_storage().release_outbox(worker_id)
+
+
+@_timed
+def complete_outbox(sent, retry, failed, now: float):
+    return get_storage().complete_outbox(sent, retry, failed, now)
+
+
+@_timed
+def get_outbox_backlog() -> tuple[int, float | None]:
+    return get_storage().get_outbox_backlog()
+
+
+@_timed
+def delete_outbox_before(day: str):
+    return get_storage().delete_outbox_before(day)
+
+
+@_timed
 def get_all_chats_with_settings(default_hour: int, default_minute: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT chat_id, enabled, hour, minute FROM chats")
-    rows = cur.fetchall()
-    conn.close()
-
-    chats = []
-    for row in rows:
-        chat_id, enabled, hour, minute = row[0], row[1], row[2], row[3]
-        if hour is None:
-            hour = default_hour
-        if minute is None:
-            minute = default_minute
-        chats.append({
-            "chat_id": chat_id,
-            "enabled": bool(enabled),
-            "hour": int(hour),
-            "minute": int(minute),
-        })
-    return chats
+    return get_storage().get_all_chats_with_settings(default_hour, default_minute)
 
 
+@_timed
 def add_birthday(user_id: int, chat_id: int, name: str, date_str: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO birthdays (user_id, chat_id, name, date) VALUES (?, ?, ?, ?)",
-        (user_id, chat_id, name, date_str),
-    )
-    conn.commit()
-    conn.close()
+    return get_storage().add_birthday(user_id, chat_id, name, date_str)
 
 
-def get_today_birthdays(chat_id: int):
-    today_md = datetime.now().strftime("%m-%d")
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT user_id, name, date FROM birthdays WHERE chat_id = ?",
-        (chat_id,),
-    )
-    rows = cur.fetchall()
-    conn.close()
+@_timed
+def get_birthdays_for_day(chat_id: int, month: int, day: int):
+    return get_storage().get_birthdays_for_day(chat_id, month, day)
+
+
+@_timed
+def get_birthdays_for_chats(chat_ids, month: int, day: int):
+    return get_storage().get_birthdays_for_chats(chat_ids, month, day)
 
-    result = []
-    for row in rows:
-        user_id, name, date_str = row[0], row[1], row[2]
-        _, m, d = date_str.split("-")
-        if f"{m}-{d}" == today_md:
-            result.append((user_id, name, date_str))
-    return result
 
+@_timed
+def get_birthdays_for_days(mds):
+    return get_storage().get_birthdays_for_days(mds)
 
+
+@_timed
+def get_greetings(day: str, birthday_ids) -> dict[int, str]:
+    return get_storage().get_greetings(day, birthday_ids)
+
+
+@_timed
+def save_greetings(day: str, items):
+    return get_storage().save_greetings(day, items)
+
+
+@_timed
+def delete_greetings_before(day: str):
+    return get_storage().delete_greetings_before(day)
+
+
+@_timed
 def list_birthdays(chat_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, user_id, name, date FROM birthdays WHERE chat_id = ? ORDER BY date",
-        (chat_id,),
+    return get_storage().list_birthdays(chat_id)
+
+
+@_timed
+def list_birthdays_page(
+    chat_id: int, after_md: int, after_id: int, limit: int,
+    user_id: int | None = None, backward: bool = False,
+):
+    return get_storage().list_birthdays_page(
+        chat_id, after_md, after_id, limit, user_id, backward
     )
-    rows = cur.fetchall()
-    conn.close()
-    return [tuple(row) for row in rows]
 
 
+@_timed
+def import_birthdays(chat_id: int, user_id: int, rows) -> tuple[int, int]:
+    return get_storage().import_birthdays(chat_id, user_id, rows)
+
+
+@_timed
 def delete_birthday(chat_id: int, record_id: int) -> bool:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "DELETE FROM birthdays WHERE chat_id = ? AND id = ?",
-        (chat_id, record_id),
-    )
-    deleted = cur.rowcount
-    conn.commit()
-    conn.close()
-    return deleted > 0
+    return get_storage().delete_birthday(chat_id, record_id)
 
 
+@_timed
 def list_birthdays_by_user(chat_id: int, user_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, name, date FROM birthdays WHERE chat_id = ? AND user_id = ? ORDER BY date",
-        (chat_id, user_id),
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return [tuple(row) for row in rows]
+    return get_storage().list_birthdays_by_user(chat_id, user_id)
 
 
+@_timed
 def delete_birthday_by_user(chat_id: int, user_id: int, record_id: int) -> bool:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "DELETE FROM birthdays WHERE chat_id = ? AND user_id = ? AND id = ?",
-        (chat_id, user_id, record_id),
-    )
-    deleted = cur.rowcount
-    conn.commit()
-    conn.close()
-    return deleted > 0
+    return get_storage().delete_birthday_by_user(chat_id, user_id, record_id)
+
+
+@_timed
+def get_greeting_templates(fingerprint: str):
+    return get_storage().get_greeting_templates(fingerprint)
+
+
+@_timed
+def add_greeting_templates(fingerprint: str, texts, now: float):
+    return get_storage().add_greeting_templates(fingerprint, texts, now)
+
+
+@_timed
+def touch_greeting_templates(used):
+    return get_storage().touch_greeting_templates(used)
+
+
+@_timed
+def evict_greeting_templates(keep: int) -> int:
+    return get_storage().evict_greeting_templates(keep)
@@ -0,0 +1,100 @@
+# db_async.py
+"""
+Асинхронный доступ к базе для хендлеров.
+
+Все вызовы db.py выполняются в выделенных потоках (очередь
+ThreadPoolExecutor), поэтому медленный диск или ожидание блокировки
+не останавливают обработку апдейтов в event loop. Для SQLite поток
+один, для PostgreSQL — по размеру пула соединений.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import tracing
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=db.get_storage().max_workers, thread_name_prefix="db"
+        )
+    return _executor
+
+
+async def run(fn, *args, **kwargs):
+    """Выполнить синхронную функцию fn(*args, **kwargs) в потоке БД."""
+    loop = asyncio.get_running_loop()
+    # Отрезок трассы включает ожидание свободного потока БД
+    with tracing.span("db." + fn.__name__.lstrip("_")):
+        return await loop.run_in_executor(
+            _get_executor(), functools.partial(fn, *args, **kwargs)
+        )
+
+
+def _async(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return wrapper
+
+
+async def register_chat(chat_id: int, default_hour: int, default_minute: int) -> bool:
+    # Известный чат не стоит даже перехода в поток БД
+    if db.is_known_chat(chat_id):
+        return False
+    return await run(db.register_chat, chat_id, default_hour, default_minute)
+
+
+async def chat_exists(chat_id: int) -> bool:
+    return db.is_known_chat(chat_id) or await run(db.chat_exists, chat_id)
+
+
+set_chat_enabled = _async(db.set_chat_enabled)
+set_chat_time = _async(db.set_chat_time)
+get_chat_tz = _async(db.get_chat_tz)
+set_chat_tz = _async(db.set_chat_tz)
+refresh_utc_offsets = _async(db.refresh_utc_offsets)
+get_chat_slots = _async(db.get_chat_slots)
+get_chat_slots_changed_since = _async(db.get_chat_slots_changed_since)
+mark_sent = _async(db.mark_sent)
+heartbeat = _async(db.heartbeat)
+get_live_workers = _async(db.get_live_workers)
+claim_sends = _async(db.claim_sends)
+get_unsent_chats = _async(db.get_unsent_chats)
+delete_send_leases_before = _async(db.delete_send_leases_before)
+enqueue_outbox = _async(db.enqueue_outbox)
+claim_outbox = _async(db.claim_outbox)
+release_outbox = _async(db.release_outbox)
+complete_outbox = _async(db.complete_outbox)
+get_outbox_backlog = _async(db.get_outbox_backlog)
+delete_outbox_before = _async(db.delete_outbox_before)
+get_all_chats_with_settings = _async(db.get_all_chats_with_settings)
+add_birthday = _async(db.add_birthday)
+get_birthdays_for_day = _async(db.get_birthdays_for_day)
+get_birthdays_for_chats = _async(db.get_birthdays_for_chats)
+get_birthdays_for_days = _async(db.get_birthdays_for_days)
+get_greetings = _async(db.get_greetings)
+save_greetings = _async(db.save_greetings)
+delete_greetings_before = _async(db.delete_greetings_before)
+list_birthdays = _async(db.list_birthdays)
+list_birthdays_page = _async(db.list_birthdays_page)
+import_birthdays = _async(db.import_birthdays)
+delete_birthday = _async(db.delete_birthday)
+list_birthdays_by_user = _async(db.list_birthdays_by_user)
+delete_birthday_by_user = _async(db.delete_birthday_by_user)
+get_greeting_templates = _async(db.get_greeting_templates)
+add_greeting_templates = _async(db.add_greeting_templates)
+touch_greeting_templates = _async(db.touch_greeting_templates)
+evict_greeting_templates = _async(db.evict_greeting_templates)
+
+
+async def close():
+    global _executor
+    await run(db.close_db)
+    _get_executor().shutdown(wait=True)
+    _executor = None
@@ -0,0 +1,150 @@
+# dispatch.py
+"""
+Рассылка ежедневных сообщений: пул воркеров и лимиты Telegram.
+
+Telegram допускает ~30 сообщений в секунду на бота и ~20 в минуту
+в одну группу. Оба лимита соблюдаются через token bucket, а RetryAfter
+и сетевые сбои повторяются автоматически.
+"""
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from config import (
+    DISPATCH_CONCURRENCY,
+    SEND_MAX_ATTEMPTS,
+    TELEGRAM_GLOBAL_BURST,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_CHAT_RATE_PER_MIN,
+)
+from metrics import SEND_RESULTS, SEND_RETRIES, SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float):
+        """Flood control: не выдавать токены ближайшие seconds секунд."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Запас в один-два сообщения, а не в секунду лимита: иначе за скользящую
+# секунду уходит до двух лимитов и Telegram отвечает 429 с паузой для всего бота
+_global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_BURST)
+_chat_buckets: dict[int, TokenBucket] = {}
+
+
+def _chat_bucket(chat_id: int) -> TokenBucket:
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        if len(_chat_buckets) > 10_000:
+            # Полные корзины ничего не помнят — их можно выбросить
+            for idle_id in [c for c, b in _chat_buckets.items() if b.is_idle()]:
+                del _chat_buckets[idle_id]
+        rate = TELEGRAM_CHAT_RATE_PER_MIN / 60
+        bucket = _chat_buckets[chat_id] = TokenBucket(rate, 3)
+    return bucket
+
+
+def _retry_seconds(retry_after) -> float:
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+async def send_message(bot, chat_id: int, text: str, **kwargs):
+    """bot.send_message с учётом лимитов и повторами при flood control."""
+    started = time.perf_counter()
+    try:
+        result = await _send_with_retries(bot, chat_id, text, **kwargs)
+    except Exception as e:
+        SEND_RESULTS.inc(type(e).__name__)
+        raise
+    finally:
+        SEND_SECONDS.observe(value=time.perf_counter() - started)
+    SEND_RESULTS.inc("ok")
+    return result
+
+
+async def _send_with_retries(bot, chat_id: int, text: str, **kwargs):
+    for attempt in range(1, SEND_MAX_ATTEMPTS + 1):
+        await _global_bucket.acquire()
+        await _chat_bucket(chat_id).acquire()
+        try:
+            return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        except RetryAfter as e:
+            delay = _retry_seconds(e.retry_after)
+            logger.warning("Flood control for %s, retry in %.0fs", chat_id, delay)
+            _global_bucket.pause(delay)
+            if attempt == SEND_MAX_ATTEMPTS:
+                raise
+            SEND_RETRIES.inc("retry_after")
+            await asyncio.sleep(delay)
+        except BadRequest:
+            raise
+        except NetworkError as e:
+            if attempt == SEND_MAX_ATTEMPTS:
+                raise
+            delay = 2 ** attempt
+            SEND_RETRIES.inc("network")
+            logger.warning("Network error for %s (%s), retry in %ds", chat_id, e, delay)
+            await asyncio.sleep(delay)
+
+
+async def fan_out(chat_ids, job, concurrency: int = DISPATCH_CONCURRENCY):
+    """
+    Выполняет job(chat_id) для всех чатов пулом из concurrency воркеров.
+    Возвращает (успешно, с ошибкой).
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for chat_id in chat_ids:
+        queue.put_nowait(chat_id)
+
+    done = failed = 0
+
+    async def worker():
+        nonlocal done, failed
+        while True:
+            try:
+                chat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await job(chat_id)
+                done += 1
+            except Exception as e:
+                failed += 1
+                logger.exception("Error sending daily message to %s: %s", chat_id, e)
+
+    workers = min(concurrency, queue.qsize())
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return done, failed
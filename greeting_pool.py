@@ -0,0 +1,108 @@
+# greeting_pool.py
+"""
+Пул шаблонов поздравлений.
+
+Вместо запроса к YandexGPT на каждый день рождения модель заранее
+пишет шаблоны с меткой имени (yandex_gpt.NAME_PLACEHOLDER). Шаблоны
+хранятся в базе под отпечатком промпта, в памяти выдаются по кругу
+в случайном порядке, а фоновая задача раз в сутки добавляет новую
+партию и вытесняет давно не использованные (LRU) сверх
+GREETING_POOL_SIZE. Так число обращений к модели не зависит от числа
+дней рождения.
+"""
+import asyncio
+import logging
+import random
+import time
+
+from config import GREETING_CONCURRENCY, GREETING_POOL_BATCH, GREETING_POOL_SIZE
+from db_async import (
+    add_greeting_templates,
+    evict_greeting_templates,
+    get_greeting_templates,
+    touch_greeting_templates,
+)
+from yandex_gpt import NAME_PLACEHOLDER, generate_template_async, prompt_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# (id, текст) шаблонов текущего отпечатка и порядок их выдачи
+_templates: list[tuple[int, str]] = []
+_order: list[int] = []
+_cursor = 0
+# id шаблона -> момент использования, ещё не записанный в базу
+_used: dict[int, float] = {}
+_refill_lock: asyncio.Lock | None = None
+
+
+def _set_templates(templates):
+    global _templates, _order, _cursor
+    _templates = list(templates)
+    _order = list(range(len(_templates)))
+    random.shuffle(_order)
+    _cursor = 0
+
+
+def size() -> int:
+    return len(_templates)
+
+
+def render(mention: str) -> str | None:
+    """Поздравление из следующего шаблона пула или None, если пул пуст."""
+    global _cursor
+    if not _templates:
+        return None
+    if _cursor >= len(_order):
+        random.shuffle(_order)
+        _cursor = 0
+    template_id, text = _templates[_order[_cursor]]
+    _cursor += 1
+    _used[template_id] = time.time()
+    return text.replace(NAME_PLACEHOLDER, mention)
+
+
+async def load():
+    _set_templates(await get_greeting_templates(prompt_fingerprint()))
+
+
+async def _generate_batch(count: int) -> list[str]:
+    limit = asyncio.Semaphore(GREETING_CONCURRENCY)
+
+    async def one():
+        async with limit:
+            return await generate_template_async()
+
+    texts = await asyncio.gather(*(one() for _ in range(count)))
+    # Повторы модели в пуле не нужны
+    return list(dict.fromkeys(t for t in texts if t))
+
+
+async def refill(rotate: bool = True):
+    """
+    Сохраняет отметки использования, генерирует партию новых шаблонов
+    и вытесняет лишние. Без rotate партия генерируется, только если
+    пул меньше одной партии (первый запуск, сменился промпт).
+    """
+    global _refill_lock
+    if _refill_lock is None:
+        _refill_lock = asyncio.Lock()
+
+    async with _refill_lock:
+        if _used:
+            used = list(_used.items())
+            _used.clear()
+            await touch_greeting_templates(used)
+
+        await load()
+        if not rotate and size() >= GREETING_POOL_BATCH:
+            return
+
+        texts = await _generate_batch(GREETING_POOL_BATCH)
+        if texts:
+            await add_greeting_templates(prompt_fingerprint(), texts, time.time())
+        evicted = await evict_greeting_templates(GREETING_POOL_SIZE)
+        await load()
+        logger.info(
+            "Greeting pool: %d new, %d evicted, %d available",
+            len(texts), evicted, size(),
+        )
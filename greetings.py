@@ -0,0 +1,95 @@
+# greetings.py
+"""
+Генерация поздравлений: шаблоны из пула (greeting_pool.py), а пока пул
+пуст — параллельные запросы к YandexGPT с ограничением; заблаговременная
+подготовка текстов, чтобы в момент отправки их оставалось только
+прочитать из базы.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+
+import dayplan
+import greeting_pool
+import schedule
+import sharding
+from config import GREETING_CONCURRENCY, GREETING_LEAD_MINUTES
+from db_async import get_greetings, save_greetings
+from yandex_gpt import fallback_text, generate_birthday_text_async
+
+logger = logging.getLogger(__name__)
+
+_llm_limit: asyncio.Semaphore | None = None
+
+
+def mention_html(user_id: int, name: str) -> str:
+    return f"<a href=\"tg://user?id={user_id}\">{name}</a>"
+
+
+async def _generate(mention: str) -> str:
+    global _llm_limit
+    text = greeting_pool.render(mention)
+    if text is not None:
+        return text
+
+    if _llm_limit is None:
+        _llm_limit = asyncio.Semaphore(GREETING_CONCURRENCY)
+    async with _llm_limit:
+        return await generate_birthday_text_async(mention)
+
+
+async def greetings_for(day: date, birthdays) -> list[str]:
+    """
+    Поздравления для записей (id, user_id, name, date) на дату day.
+    Готовые берутся из базы, недостающие генерируются параллельно
+    и сохраняются.
+    """
+    day_str = day.isoformat()
+    stored = await get_greetings(day_str, (rec_id for rec_id, _, _, _ in birthdays))
+    missing = [b for b in birthdays if b[0] not in stored]
+    if missing:
+        mentions = [mention_html(user_id, name) for _, user_id, name, _ in missing]
+        texts = await asyncio.gather(*(_generate(m) for m in mentions))
+        generated = dict(zip((b[0] for b in missing), texts))
+        # Заглушку при сбое API не сохраняем: к отправке попробуем ещё раз
+        await save_greetings(day_str, [
+            (b[0], text)
+            for b, mention, text in zip(missing, mentions, texts)
+            if text != fallback_text(mention)
+        ])
+        stored.update(generated)
+    return [stored[rec_id] for rec_id, _, _, _ in birthdays]
+
+
+async def pregenerate(now: datetime, window_minutes: int = 60):
+    """
+    Готовит поздравления для чатов, у которых время рассылки наступит
+    через GREETING_LEAD_MINUTES (в том числе завтрашние), на окно
+    window_minutes минут вперёд. now — aware datetime.
+    """
+    start = now + timedelta(minutes=GREETING_LEAD_MINUTES)
+    # Местная дата рассылки у каждого чата своя
+    by_day: dict[date, list[int]] = {}
+    for offset in range(window_minutes):
+        target = start + timedelta(minutes=offset)
+        minute = schedule.minute_of_day(target.hour, target.minute)
+        for chat_id in schedule.due_chats_utc(minute):
+            if not sharding.owns(chat_id):
+                continue
+            day = schedule.local_date(chat_id, target)
+            by_day.setdefault(day, []).append(chat_id)
+
+    count = 0
+    for day, chat_ids in by_day.items():
+        by_chat = await dayplan.get_birthdays(chat_ids, day)
+        for chat_id, birthdays in by_chat.items():
+            try:
+                await greetings_for(day, birthdays)
+                count += len(birthdays)
+            except Exception as e:
+                logger.exception("Error pre-generating greetings for %s: %s", chat_id, e)
+    if count:
+        logger.info(
+            "Pre-generated %d greetings for %s UTC + %d min",
+            count, start.strftime("%Y-%m-%d %H:%M"), window_minutes,
+        )
@@ -1,30 +1,82 @@
 # handlers.py
+import asyncio
 import logging
-from datetime import datetime
+import time
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from telegram.constants import ChatType
-from telegram import Update, ChatMemberAdministrator, ChatMemberOwner
+from telegram import Update, ChatMember, ChatMemberAdministrator, ChatMemberOwner
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from config import DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE
-
-from db import (
+from config import (
+    ADMIN_USER_IDS,
+    DAILY_RETRY_ATTEMPTS,
+    DAILY_RETRY_SECONDS,
+    DEFAULT_JOB_HOUR,
+    DEFAULT_JOB_MINUTE,
+    IMPORT_MAX_BYTES,
+    OUTBOX_BATCH,
+    PROFILE_SECONDS,
+    SCHEDULE_SYNC_INTERVAL,
+    SEND_FAILOVER_DELAY,
+    SEND_LEASE_SECONDS,
+    WORKER_ID,
+    WORKER_TIMEOUT,
+)
+import admin_cache
+import bulk
+import dayplan
+import dispatch
+import greeting_pool
+import listing
+import messages
+import metrics
+import outbox
+import profiler
+import resilience
+import schedule
+import sharding
+
+import db
+import db_async
+from db_async import (
     register_chat,
-    chat_exists,
-    set_chat_enabled,
-    set_chat_time,
-    get_all_chats_with_settings,
     add_birthday,
-    get_today_birthdays,
-    list_birthdays,
+    delete_outbox_before,
+    heartbeat,
+    get_live_workers,
+    claim_sends,
+    get_unsent_chats,
+    delete_send_leases_before,
+    get_chat_tz,
+    refresh_utc_offsets,
+    get_chat_slots,
+    get_chat_slots_changed_since,
+    delete_greetings_before,
     delete_birthday,
-    list_birthdays_by_user,
     delete_birthday_by_user,
 )
-from holidays import get_today_holidays
-from yandex_gpt import generate_birthday_text
+from holidays import (
+    get_holidays_async,
+    refresh_holidays_async,
+    ensure_holidays_async,
+)
+from greetings import pregenerate
 
 logger = logging.getLogger(__name__)
 
+# Дольше профиль по команде не пишем: поток выборки держит GIL
+_PROFILE_MAX_SECONDS = 300
+
+# (chat_id, местная дата) -> неудачных попыток подготовить сообщение
+_render_failures: dict[tuple[int, date], int] = {}
+
+# Момент (time.time()) начала последней синхронизации расписания
+# (первой — полной загрузки в load_schedule)
+_schedule_synced_at = 0.0
+
+
 async def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     chat = update.effective_chat
     user = update.effective_user
@@ -36,68 +88,273 @@ async def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         return True
 
     try:
-        admins = await chat.get_administrators()
+        admin_ids = await admin_cache.get_admin_ids(chat)
         # user считается админом, если его id есть в списке админов чата
-        return any(a.user.id == user.id for a in admins)
+        return user.id in admin_ids
     except Exception as e:
         logger.exception("Error checking admin rights: %s", e)
         return False
 
+
+async def chat_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сбрасывает кэш админов, когда кто-то получает или теряет права."""
+    member_update = update.chat_member or update.my_chat_member
+    if not member_update:
+        return
+
+    admin_statuses = (ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+    old_status = member_update.old_chat_member.status
+    new_status = member_update.new_chat_member.status
+    if old_status in admin_statuses or new_status in admin_statuses:
+        admin_cache.invalidate(member_update.chat.id)
+
 # ==== DAILY SCHEDULER ====
 
-async def send_congrats_for_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
-    holidays = get_today_holidays()
-    birthdays = get_today_birthdays(chat_id)
+async def refresh_holidays_job(context: ContextTypes.DEFAULT_TYPE):
+    """Раз в сутки, после смены даты, обновляет кэш праздников в фоне."""
+    await refresh_holidays_async()
+
+
+async def warm_holidays_job(context: ContextTypes.DEFAULT_TYPE):
+    await ensure_holidays_async()
+
+
+async def cleanup_greetings_job(context: ContextTypes.DEFAULT_TYPE):
+    """Удаляет поздравления, аренды рассылок и outbox за прошедшие дни."""
+    # Самые западные пояса (UTC-12) ещё могут жить во вчерашней дате по UTC
+    yesterday = datetime.now(timezone.utc).date() - timedelta(days=1)
+    await delete_greetings_before(yesterday.isoformat())
+    await delete_send_leases_before(yesterday.isoformat())
+    await delete_outbox_before(yesterday.isoformat())
+
+
+async def heartbeat_job(context: ContextTypes.DEFAULT_TYPE):
+    """Пульс воркера и пересборка кольца по живым воркерам."""
+    now = time.time()
+    await heartbeat(WORKER_ID, now)
+    sharding.set_live_workers(await get_live_workers(now - WORKER_TIMEOUT))
+
+
+def load_schedule():
+    """
+    Полная загрузка расписания при старте (до запуска цикла событий):
+    дальше sync_schedule_job подтягивает только изменения с этого момента.
+    """
+    global _schedule_synced_at
+    started = time.time()
+    rows = db.get_chat_slots()
+    schedule.load(rows)
+    db.remember_chats(row[0] for row in rows)
+    _schedule_synced_at = started
+
+
+async def sync_schedule_job(context: ContextTypes.DEFAULT_TYPE):
+    """Подтягивает изменения расписания, сделанные через другие воркеры."""
+    global _schedule_synced_at
+    started = time.time()
+    # Перечитываем с запасом в интервал: транзакция могла зафиксироваться
+    # позже своей метки времени, а часы воркеров — немного расходиться
+    rows = await get_chat_slots_changed_since(_schedule_synced_at - SCHEDULE_SYNC_INTERVAL)
+    schedule.update(rows)
+    # Среди изменений — дни рождения, добавленные через другие воркеры
+    await dayplan.refresh_chats(row[0] for row in rows)
+    _schedule_synced_at = started
+    db.remember_chats(row[0] for row in rows)
+
+
+async def day_plan_job(context: ContextTypes.DEFAULT_TYPE):
+    """После полуночи по UTC (и при старте) строит план рассылки на сутки."""
+    result = await dayplan.build()
+    if result is not None:
+        logger.info("Day plan built: %d birthdays in %d chats", result[1], result[0])
+    # Разделы праздников дней плана рендерятся заранее, а не в момент рассылки
+    for day in dayplan.days():
+        await messages.holiday_section(day)
+
+
+async def greeting_pool_job(context: ContextTypes.DEFAULT_TYPE):
+    """Раз в сутки обновляет пул шаблонов поздравлений."""
+    await greeting_pool.refill()
+
+
+async def warm_greeting_pool_job(context: ContextTypes.DEFAULT_TYPE):
+    await greeting_pool.refill(rotate=False)
+
+
+async def pregenerate_job(context: ContextTypes.DEFAULT_TYPE):
+    """Раз в час готовит поздравления для рассылок через GREETING_LEAD_MINUTES."""
+    await pregenerate(datetime.now(timezone.utc))
+
+
+async def refresh_timezones_job(context: ContextTypes.DEFAULT_TYPE):
+    """Пересчитывает смещения поясов (летнее время) и обновляет расписание."""
+    if await refresh_utc_offsets():
+        # Перепланируются только чаты, у которых сменилось смещение
+        schedule.update(await get_chat_slots())
+
+
+async def _deliver(context: ContextTypes.DEFAULT_TYPE, chat_ids, day):
+    """
+    Готовит сообщения за day и ставит их в outbox пачками по OUTBOX_BATCH;
+    отправляет их outbox.py. Чат отмечается отправленным вместе с
+    постановкой в очередь — дальше за доставку отвечает очередь.
+    """
+    started = time.monotonic()
+    day_str = day.isoformat()
+    # (chat_id, текст или None, если писать нечего)
+    ready = []
+    # Чаты, которые не удалось подготовить или поставить в очередь
+    failed = []
+    queued = 0
+
+    async def flush():
+        nonlocal queued
+        batch = ready[:]
+        ready.clear()
+        try:
+            await db_async.run(_enqueue, batch, day_str)
+        except Exception as e:
+            logger.exception("Failed to queue %d daily messages: %s", len(batch), e)
+            failed.extend(chat_id for chat_id, _ in batch)
+            return
+        queued += len(batch)
+        for chat_id, _ in batch:
+            _render_failures.pop((chat_id, day), None)
+        outbox.wake()
+
+    async def render(chat_id: int):
+        try:
+            text = await messages.compose(chat_id, day, birthdays.get(chat_id, []))
+        except Exception:
+            failed.append(chat_id)
+            raise
+        ready.append((chat_id, text))
+        if len(ready) >= OUTBOX_BATCH:
+            await flush()
 
-    parts = []
+    try:
+        # Записи берутся из плана на сутки, а без него — одним запросом на все чаты
+        birthdays = await dayplan.get_birthdays(chat_ids, day)
+    except Exception as e:
+        logger.exception("Failed to load birthdays for %s: %s", day_str, e)
+        failed.extend(chat_ids)
+    else:
+        await dispatch.fan_out(chat_ids, render)
+        if ready:
+            await flush()
+    # Сегодняшняя минута чатов уже снята с расписания: без повтора их
+    # сообщение за day потерялось бы до рестарта
+    _retry_later(failed, day)
+    metrics.DAILY_SEND_SECONDS.observe(value=time.monotonic() - started)
+    metrics.DAILY_SEND_CHATS.inc("queued", amount=queued)
+    metrics.DAILY_SEND_CHATS.inc("failed", amount=len(failed))
+    logger.info(
+        "Daily send %s: %d chats queued, %d failed in %.2fs",
+        day_str, queued, len(failed), time.monotonic() - started,
+    )
 
-    if holidays:
-        holidays_text = "\n".join(f"• {h}" for h in holidays)
-        parts.append("🎊 Праздники сегодня:\n" + holidays_text)
 
-    if birthdays:
-        lines = []
-        for user_id, name, _ in birthdays:
-            mention = f"<a href=\"tg://user?id={user_id}\">{name}</a>"
-            lines.append(generate_birthday_text(mention))
-        parts.append("🎂 Дни рождения сегодня:\n" + "\n".join(lines))
+def _retry_later(chat_ids, day):
+    """
+    Возвращает в расписание на повтор через DAILY_RETRY_SECONDS (с
+    удвоением) чаты, чьё сообщение за day не подготовлено. После
+    DAILY_RETRY_ATTEMPTS попыток или с наступлением следующих суток чата
+    сообщение за day пропускается.
+    """
+    now = datetime.now(timezone.utc)
+    for chat_id in chat_ids:
+        key = (chat_id, day)
+        attempts = _render_failures.get(key, 0) + 1
+        at = now + timedelta(seconds=DAILY_RETRY_SECONDS * 2 ** (attempts - 1))
+        if attempts < DAILY_RETRY_ATTEMPTS and schedule.retry(chat_id, day, at):
+            _render_failures[key] = attempts
+        else:
+            _render_failures.pop(key, None)
+            logger.error(
+                "Daily message for %s on %s skipped after %d failed attempts",
+                chat_id, day.isoformat(), attempts,
+            )
 
-    if not parts:
-        return
 
-    text = "\n\n".join(parts)
+def _enqueue(batch, day_str: str):
+    """Постановка в outbox и mark_sent одной транзакцией (в потоке БД)."""
+    with db.transaction():
+        db.enqueue_outbox(
+            [(chat_id, day_str, text) for chat_id, text in batch if text], time.time()
+        )
+        for chat_id, _ in batch:
+            db.mark_sent(chat_id, day_str)
+
+
+async def _failover(context: ContextTypes.DEFAULT_TYPE, chat_ids, day):
+    """
+    Чаты других воркеров: если владелец не отправил их за
+    SEND_FAILOVER_DELAY (упал или завис), берём их аренду и отправляем сами.
+    """
+    day_str = day.isoformat()
+    deadline = time.monotonic() + SEND_FAILOVER_DELAY + 2 * SEND_LEASE_SECONDS
+    pending = list(chat_ids)
+    while pending and time.monotonic() < deadline:
+        await asyncio.sleep(SEND_FAILOVER_DELAY)
+        pending = await get_unsent_chats(pending, day_str)
+        if not pending:
+            return
+        claimed = await claim_sends(pending, day_str, WORKER_ID, time.time(), SEND_LEASE_SECONDS)
+        if claimed:
+            logger.warning("Failover: taking over %d chats for %s", len(claimed), day_str)
+            await _deliver(context, claimed, day)
+            taken = set(claimed)
+            pending = [chat_id for chat_id in pending if chat_id not in taken]
+
+
+async def _send_due_chats(context: ContextTypes.DEFAULT_TYPE, chat_ids, day):
+    if sharding.enabled():
+        owned = [chat_id for chat_id in chat_ids if sharding.owns(chat_id)]
+        others = [chat_id for chat_id in chat_ids if not sharding.owns(chat_id)]
+        if others:
+            context.application.create_task(
+                _failover(context, others, day), name=f"failover_{day.isoformat()}"
+            )
+        # Аренда защищает от двойной отправки, пока воркеры расходятся во мнении о владельце
+        chat_ids = await claim_sends(
+            owned, day.isoformat(), WORKER_ID, time.time(), SEND_LEASE_SECONDS
+        )
+    if chat_ids:
+        await _deliver(context, chat_ids, day)
 
-    await context.bot.send_message(
-        chat_id=chat_id,
-        text=text,
-        parse_mode="HTML",
-        disable_web_page_preview=True,
-    )
 
 async def scheduler_tick(context: ContextTypes.DEFAULT_TYPE):
-    now = datetime.now()
-    now_h = now.hour
-    now_m = now.minute
-
-    chats = get_all_chats_with_settings(DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
-    for chat in chats:
-        if not chat["enabled"]:
-            continue
-        if chat["hour"] == now_h and chat["minute"] == now_m:
-            try:
-                await send_congrats_for_chat(context, chat["chat_id"])
-            except Exception as e:
-                logger.exception(
-                    "Error sending daily message to %s: %s", chat["chat_id"], e
-                )
+    """Срабатывает в момент ближайшей рассылки (см. scheduler.rearm)."""
+    with metrics.SCHEDULER_TICK_SECONDS.time():
+        due = schedule.pop_due()
+
+        by_day = {}
+        for chat_id, day in due:
+            by_day.setdefault(day, []).append(chat_id)
+    metrics.DUE_CHATS.inc(amount=len(due))
+
+    # Рассылка идёт отдельной задачей, чтобы долгая отправка не задержала
+    # следующее срабатывание
+    for day, chat_ids in by_day.items():
+        context.application.create_task(
+            _send_due_chats(context, chat_ids, day),
+            name=f"daily_send_{day.isoformat()}",
+        )
 
 
 # ==== COMMAND HANDLERS ====
 
+def _register_and_update(chat_id: int, update_fn, *args):
+    """register_chat и изменение настроек чата одной транзакцией (в потоке БД)."""
+    with db.transaction():
+        db.register_chat(chat_id, DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
+        return update_fn(chat_id, *args)
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
     if chat:
-            register_chat(chat.id, DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
+            await register_chat(chat.id, DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
 
     await update.message.reply_text(
         "Привет! Я буду напоминать о праздниках и днях рождения.\n\n"
@@ -108,9 +365,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Команды только для админов:\n"
         "/list_bdays — все дни рождения\n"
         "/del_bday ID — удалить любую запись\n"
+        "/import — загрузить записи из файла CSV/JSON\n"
+        "/export [csv|json] — выгрузить записи файлом\n"
         "/enable — включить ежедневные поздравления\n"
         "/disable — выключить ежедневные поздравления\n"
-        "/time HH:MM — установить время поздравления"
+        "/time HH:MM — установить время поздравления\n"
+        "/tz Область/Город — часовой пояс чата"
     )
 
 
@@ -119,14 +379,13 @@ async def add_chat_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not chat:
         return
 
-    if chat_exists(chat.id):
+    if await register_chat(chat.id, DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE):
         await update.message.reply_text(
-            "Этот чат уже есть в списке для ежедневных поздравлений."
+            f"Чат {chat.id} добавлен в список для ежедневных поздравлений."
         )
     else:
-        register_chat(chat.id, DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
         await update.message.reply_text(
-            f"Чат {chat.id} добавлен в список для ежедневных поздравлений."
+            "Этот чат уже есть в списке для ежедневных поздравлений."
         )
 
 
@@ -134,7 +393,7 @@ async def bday(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
     message = update.effective_message  # вместо update.message
     if chat:
-        register_chat(chat.id, DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
+        await register_chat(chat.id, DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
 
     if not context.args or len(context.args) < 2:
         if message:
@@ -146,10 +405,8 @@ async def bday(update: Update, context: ContextTypes.DEFAULT_TYPE):
     date_part = context.args[0]
     name = " ".join(context.args[1:])
 
-    try:
-        day, month = map(int, date_part.split("."))
-        date_str = f"2000-{month:02d}-{day:02d}"
-    except Exception:
+    date_str = bulk.parse_day_month(date_part)
+    if date_str is None:
         if message:
             await message.reply_text("Неверный формат даты, нужно DD.MM")
         return
@@ -158,7 +415,9 @@ async def bday(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not (chat and user and message):
         return
 
-    add_birthday(user.id, chat.id, name, date_str)
+    await add_birthday(user.id, chat.id, name, date_str)
+    messages.invalidate(chat.id)
+    await dayplan.refresh(chat.id, date_str)
     await message.reply_text(
         f"Записал день рождения: {name} — {date_part}"
     )
@@ -169,18 +428,11 @@ async def list_my_bdays_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not chat or not user:
         return
 
-    rows = list_birthdays_by_user(chat.id, user.id)
-    if not rows:
+    text, markup = await listing.render_page(chat.id, user.id)
+    if text is None:
         await update.message.reply_text("У тебя пока нет записанных дней рождения в этом чате.")
         return
-
-    lines = []
-    for rec_id, name, date_str in rows:
-        _, m, d = date_str.split("-")
-        lines.append(f"{rec_id}: {d}.{m} — {name}")
-
-    text = "Твои дни рождения в этом чате:\n" + "\n".join(lines)
-    await update.message.reply_text(text)
+    await update.message.reply_text(text, reply_markup=markup)
 
 
 async def del_my_bday_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -199,7 +451,9 @@ async def del_my_bday_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("ID должен быть числом.")
         return
 
-    if delete_birthday_by_user(chat.id, user.id, rec_id):
+    if await delete_birthday_by_user(chat.id, user.id, rec_id):
+        messages.invalidate(chat.id)
+        dayplan.remove(chat.id, rec_id)
         await update.message.reply_text(f"Твоя запись с ID {rec_id} удалена.")
     else:
         await update.message.reply_text("Такой записи у тебя нет.")
@@ -214,18 +468,41 @@ async def list_bdays_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Эта команда доступна только администраторам чата.")
         return
 
-    rows = list_birthdays(chat.id)
-    if not rows:
+    text, markup = await listing.render_page(chat.id, listing.ALL)
+    if text is None:
         await update.message.reply_text("В этом чате пока нет записанных дней рождения.")
         return
+    await update.message.reply_text(text, reply_markup=markup)
 
-    lines = []
-    for rec_id, user_id, name, date_str in rows:
-        _, m, d = date_str.split("-")
-        lines.append(f"{rec_id}: {d}.{m} — {name} (user_id={user_id})")
 
-    text = "Список дней рождения:\n" + "\n".join(lines)
-    await update.message.reply_text(text)
+async def list_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопки ◀️ / ▶️ под списками: перерисовывает сообщение нужной страницей."""
+    query = update.callback_query
+    chat = update.effective_chat
+    parsed = listing.parse_callback_data(query.data or "")
+    if not chat or parsed is None:
+        await query.answer()
+        return
+
+    owner, backward, key = parsed
+    if owner == listing.ALL:
+        if not await is_admin(update, context):
+            await query.answer("Список доступен только администраторам чата.", show_alert=True)
+            return
+    elif owner != query.from_user.id:
+        await query.answer("Это чужой список: открой свой через /list_my_bdays.", show_alert=True)
+        return
+
+    text, markup = await listing.render_page(chat.id, owner, key, backward)
+    await query.answer()
+    if text is None:
+        text = "Записей больше нет."
+    try:
+        await query.edit_message_text(text, reply_markup=markup)
+    except BadRequest as e:
+        # Повторное нажатие на ту же кнопку — текст не изменился
+        if "not modified" not in str(e).lower():
+            raise
 
 
 async def del_bday_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -247,12 +524,95 @@ async def del_bday_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("ID должен быть числом.")
         return
 
-    if delete_birthday(chat.id, rec_id):
+    if await delete_birthday(chat.id, rec_id):
+        messages.invalidate(chat.id)
+        dayplan.remove(chat.id, rec_id)
         await update.message.reply_text(f"Запись с ID {rec_id} удалена.")
     else:
         await update.message.reply_text("Такой записи нет в этом чате.")
 
 
+async def import_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /import — подписью к файлу CSV/JSON или ответом на сообщение с файлом.
+    Записи с тем же user_id и именем обновляются; строки без user_id
+    принадлежат загружающему.
+    """
+    chat = update.effective_chat
+    user = update.effective_user
+    message = update.effective_message
+    if not (chat and user and message):
+        return
+
+    if not await is_admin(update, context):
+        await message.reply_text("Эта команда доступна только администраторам чата.")
+        return
+
+    document = message.document
+    if document is None and message.reply_to_message:
+        document = message.reply_to_message.document
+    if document is None:
+        await message.reply_text(
+            "Пришли файл CSV или JSON с подписью /import или ответь /import на сообщение с файлом.\n"
+            "CSV: date;name[;user_id], например 06.02;Иван\n"
+            "JSON: [{\"date\": \"06.02\", \"name\": \"Иван\"}]"
+        )
+        return
+    too_big = f"Файл слишком большой: не больше {IMPORT_MAX_BYTES // 1024} КБ."
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await message.reply_text(too_big)
+        return
+
+    tg_file = await document.get_file()
+    data = bytes(await tg_file.download_as_bytearray())
+    if len(data) > IMPORT_MAX_BYTES:
+        await message.reply_text(too_big)
+        return
+    try:
+        rows = await asyncio.to_thread(bulk.parse_import, data, document.file_name or "")
+    except bulk.InvalidFile as e:
+        await message.reply_text(str(e))
+        return
+
+    added, updated = await db_async.run(
+        _register_and_update, chat.id, db.import_birthdays, user.id, rows
+    )
+    messages.invalidate(chat.id)
+    # Загрузка может и добавить, и перенести записи на дни плана
+    await dayplan.refresh(chat.id)
+    await message.reply_text(f"Загружено: добавлено {added}, обновлено {updated}.")
+
+
+async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export [csv|json] — все дни рождения чата файлом."""
+    chat = update.effective_chat
+    message = update.effective_message
+    if not (chat and message):
+        return
+
+    if not await is_admin(update, context):
+        await message.reply_text("Эта команда доступна только администраторам чата.")
+        return
+
+    fmt = (context.args[0].lower() if context.args else "csv")
+    if fmt not in ("csv", "json"):
+        await message.reply_text("Формат: /export csv или /export json")
+        return
+
+    out, count = await bulk.export_file(chat.id, fmt)
+    with out:
+        if not count:
+            await message.reply_text("В этом чате пока нет записанных дней рождения.")
+            return
+        # PTB всё равно собирает загрузку в памяти; до этого момента
+        # выгрузка лежит во временном файле, а не в списке записей
+        await message.reply_document(
+            document=out.read(),
+            filename=f"birthdays_{chat.id}.{fmt}",
+            caption=f"Дней рождения: {count}",
+        )
+
+
 async def enable_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
     if not chat:
@@ -262,8 +622,7 @@ async def enable_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Эта команда доступна только администраторам чата.")
         return
 
-    register_chat(chat.id, DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
-    set_chat_enabled(chat.id, True)
+    await db_async.run(_register_and_update, chat.id, db.set_chat_enabled, True)
     await update.message.reply_text("Ежедневные поздравления включены для этого чата.")
 
 
@@ -276,8 +635,7 @@ async def disable_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Эта команда доступна только администраторам чата.")
         return
 
-    register_chat(chat.id, DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
-    set_chat_enabled(chat.id, False)
+    await db_async.run(_register_and_update, chat.id, db.set_chat_enabled, False)
     await update.message.reply_text("Ежедневные поздравления отключены для этого чата.")
 
 
@@ -307,21 +665,98 @@ async def time_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Неверный формат времени, нужно HH:MM (00–23:59).")
         return
 
-    register_chat(chat.id, DEFAULT_JOB_HOUR, DEFAULT_JOB_MINUTE)
-    set_chat_time(chat.id, hour, minute)
+    await db_async.run(_register_and_update, chat.id, db.set_chat_time, hour, minute)
     await update.message.reply_text(
         f"Время ежедневных поздравлений для этого чата установлено на {hour:02d}:{minute:02d}."
     )
+
+
+async def tz_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat = update.effective_chat
+    if not chat:
+        return
+
+    if not context.args:
+        tz_name = await get_chat_tz(chat.id)
+        await update.message.reply_text(
+            f"Часовой пояс чата: {tz_name or 'по умолчанию'}.\n"
+            "Формат: /tz Область/Город\nНапример: /tz Europe/Moscow, /tz Asia/Kamchatka"
+        )
+        return
+
+    if not await is_admin(update, context):
+        await update.message.reply_text("Эта команда доступна только администраторам чата.")
+        return
+
+    tz_name = context.args[0]
+    try:
+        ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        await update.message.reply_text(
+            "Не знаю такой часовой пояс. Например: Europe/Kaliningrad, Europe/Moscow, Asia/Kamchatka."
+        )
+        return
+
+    await db_async.run(_register_and_update, chat.id, db.set_chat_tz, tz_name)
+    await update.message.reply_text(
+        f"Часовой пояс чата установлен: {tz_name}. Время поздравлений считается по нему."
+    )
+
+
 async def debug_holidays_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
     message = update.effective_message
     if not chat or not message:
         return
 
-    holidays = get_today_holidays()
+    holidays = await get_holidays_async(schedule.local_today(chat.id).isoformat())
     if not holidays:
         await message.reply_text("API праздников вернуло пусто на сегодня.")
         return
 
     text = "🎊 Праздники сегодня (debug):\n" + "\n".join(f"• {h}" for h in holidays)
     await message.reply_text(text)
+
+
+async def debug_upstreams_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Состояние предохранителей внешних API."""
+    message = update.effective_message
+    if not message:
+        return
+
+    lines = []
+    for s in resilience.snapshot():
+        latency = (
+            f"p50 {s['p50']:.2f}s, p95 {s['p95']:.2f}s" if s["p95"] is not None else "мало данных"
+        )
+        lines.append(
+            f"• {s['name']}: {s['state']}, сбоев подряд {s['failures']}, "
+            f"таймаут {s['timeout']:.1f}s, {latency}"
+        )
+    await message.reply_text("Внешние API (debug):\n" + "\n".join(lines))
+
+
+async def profile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [секунды] — профиль процесса в PROFILE_DIR (только ADMIN_USER_IDS)."""
+    message = update.effective_message
+    user = update.effective_user
+    if not (message and user):
+        return
+    if user.id not in ADMIN_USER_IDS:
+        await message.reply_text("Эта команда доступна только владельцу бота.")
+        return
+
+    try:
+        seconds = int(context.args[0]) if context.args else PROFILE_SECONDS
+    except ValueError:
+        await message.reply_text("Формат: /profile [секунды]")
+        return
+    seconds = max(1, min(seconds, _PROFILE_MAX_SECONDS))
+
+    await message.reply_text(f"Профилирую {seconds} с…")
+    result = await asyncio.to_thread(profiler.record, seconds)
+    if result is None:
+        await message.reply_text("Профиль уже пишется, дождись его окончания.")
+        return
+    path, samples = result
+    await message.reply_text(f"Готово: {path} ({samples} выборок).")
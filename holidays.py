@@ -1,34 +1,115 @@
 # holidays.py
+import asyncio
+import json
+import logging
 import os
-from datetime import datetime
-from config import RUS_CALENDAR_BASE
+import time
+from config import RUS_CALENDAR_BASE, HOLIDAYS_CACHE_PATH, HOLIDAYS_TTL
 
-import requests
+import http_client
+from resilience import CircuitOpen, calendar_api
 
 RUS_CALENDAR_BASE = os.getenv("RUS_CALENDAR_BASE", "https://russian-calendar.example.com/api")
 HOLIDAYS_ENDPOINT = f"{RUS_CALENDAR_BASE}/holidays"
 
-def get_today_holidays():
+logger = logging.getLogger(__name__)
+
+# Кэш календаря: "YYYY-MM-DD" -> список праздников
+_by_date: dict[str, list[str]] = {}
+_fetched_at = 0.0
+_async_refresh_lock: asyncio.Lock | None = None
+
+
+def _build_index(data) -> dict[str, list[str]]:
+    index: dict[str, list[str]] = {}
+    for item in data:
+        if "date" in item and "holidayName" in item:
+            index.setdefault(item["date"], []).append(item["holidayName"])
+    return index
+
+
+def _load_from_disk() -> bool:
+    global _by_date, _fetched_at
+    if not HOLIDAYS_CACHE_PATH:
+        return False
+    try:
+        with open(HOLIDAYS_CACHE_PATH, encoding="utf-8") as f:
+            cached = json.load(f)
+        _by_date = _build_index(cached["items"])
+        _fetched_at = float(cached["fetched_at"])
+        return True
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logger.warning("Holidays cache file is unreadable: %s", e)
+        return False
+
+
+def _save_to_disk(data):
+    if not HOLIDAYS_CACHE_PATH:
+        return
+    tmp_path = HOLIDAYS_CACHE_PATH + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": _fetched_at, "items": data}, f, ensure_ascii=False)
+        os.replace(tmp_path, HOLIDAYS_CACHE_PATH)
+    except OSError as e:
+        logger.warning("Cannot save holidays cache: %s", e)
+
+
+def _apply(data):
+    global _by_date, _fetched_at
+    _by_date = _build_index(data)
+    _fetched_at = time.time()
+    _save_to_disk(data)
+
+
+def _is_fresh() -> bool:
+    return bool(_fetched_at) and time.time() - _fetched_at <= HOLIDAYS_TTL
+
+
+async def refresh_holidays_async(force: bool = True) -> bool:
     """
-    Russian Calendar API, фильтрация по сегодняшней дате.
-    Ожидаемый формат:
-    [
-      {"date": "YYYY-MM-DD", "holidayName": "..."},
-      ...
-    ]
-    [web:7][web:21]
+    Скачивает весь календарь один раз и перестраивает индекс по датам.
+    При ошибке остаётся прежний кэш.
     """
-    today = datetime.now().strftime("%Y-%m-%d")
-    try:
-        resp = requests.get(HOLIDAYS_ENDPOINT, timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
-    except Exception:
-        return []
-
-    holidays_today = [
-        item["holidayName"]
-        for item in data
-        if item.get("date") == today and "holidayName" in item
-    ]
-    return holidays_today
\ No newline at end of file
+    global _async_refresh_lock
+    if _async_refresh_lock is None:
+        _async_refresh_lock = asyncio.Lock()
+    async with _async_refresh_lock:
+        # Пока ждали блокировку, кэш мог обновить другой запрос
+        if not force and _is_fresh():
+            return True
+        try:
+            data = await calendar_api.call(
+                lambda timeout: http_client.get_json(HOLIDAYS_ENDPOINT, timeout=timeout),
+                hedge=True,
+            )
+        except CircuitOpen:
+            # Календарь недавно не отвечал — остаёмся на кэше без ожидания
+            return False
+        except Exception as e:
+            logger.warning("Holidays API request failed: %s", e)
+            return False
+
+        await asyncio.to_thread(_apply, data)
+        return True
+
+
+async def ensure_holidays_async():
+    """Загружает кэш с диска или из API, если он пуст или устарел."""
+    if not _fetched_at:
+        await asyncio.to_thread(_load_from_disk)
+    if not _is_fresh():
+        await refresh_holidays_async(force=False)
+
+
+def version() -> float:
+    """Меняется при каждой загрузке календаря (для кэшей поверх него)."""
+    return _fetched_at
+
+
+async def get_holidays_async(date_str: str) -> list[str]:
+    await ensure_holidays_async()
+    return list(_by_date.get(date_str, ()))
+
@@ -0,0 +1,71 @@
+# http_client.py
+"""
+Общий асинхронный HTTP-клиент для внешних API (календарь, YandexGPT).
+
+Один httpx.AsyncClient с пулом keep-alive соединений на весь процесс
+и ограничение числа одновременных запросов к каждому хосту.
+"""
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+import tracing
+from config import HTTP_MAX_CONNECTIONS, HTTP_PER_HOST_LIMIT
+from metrics import HTTP_ERRORS, HTTP_SECONDS
+
+_client: httpx.AsyncClient | None = None
+_host_limits: dict[str, asyncio.Semaphore] = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=60,
+            ),
+        )
+    return _client
+
+
+def _host_limit(host: str) -> asyncio.Semaphore:
+    sem = _host_limits.get(host)
+    if sem is None:
+        sem = _host_limits[host] = asyncio.Semaphore(HTTP_PER_HOST_LIMIT)
+    return sem
+
+
+async def _request(method: str, url: str, timeout: float, **kwargs):
+    host = urlsplit(url).netloc
+    with tracing.span("http." + host):
+        async with _host_limit(host):
+            started = time.perf_counter()
+            try:
+                resp = await get_client().request(method, url, timeout=timeout, **kwargs)
+                resp.raise_for_status()
+                return resp.json()
+            except Exception:
+                HTTP_ERRORS.inc(host, method)
+                raise
+            finally:
+                HTTP_SECONDS.observe(host, method, value=time.perf_counter() - started)
+
+
+async def get_json(url: str, timeout: float, **kwargs):
+    return await _request("GET", url, timeout, **kwargs)
+
+
+async def post_json(url: str, body, timeout: float, **kwargs):
+    return await _request("POST", url, timeout, json=body, **kwargs)
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_limits.clear()
@@ -0,0 +1,164 @@
+# http_server.py
+"""
+Лёгкий HTTP-сервер на asyncio для служебных эндпоинтов на containerPort
+из amvera.yml: /metrics, /health и webhook Telegram.
+
+Маршруты регистрируются в таблице через add_route; обработчик получает
+Request и возвращает Response. Функции модуля работают с сервером
+процесса; отдельные экземпляры Server нужны, например, заменителям
+внешних API в бенчмарке. Поддерживается ровно то, что нужно
+служебным эндпоинтам: HTTP/1.1 с Content-Length, без chunked и TLS.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Ограничения на запрос, чтобы сервер нельзя было забить мусором
+_MAX_HEADER_BYTES = 16 * 1024
+_MAX_BODY_BYTES = 1024 * 1024
+_READ_TIMEOUT = 10
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    headers: dict[str, str]  # имена в нижнем регистре
+    body: bytes = b""
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+class Server:
+    """Сервер с таблицей маршрутов (метод, путь) -> async handler(Request) -> Response."""
+
+    def __init__(self):
+        self.routes: dict[tuple[str, str], object] = {}
+        self._server: asyncio.AbstractServer | None = None
+        # Открытые соединения: writer -> задача обработчика
+        self._connections: dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    def add_route(self, method: str, path: str, handler):
+        self.routes[(method.upper(), path)] = handler
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            known = any(path == request.path for _, path in self.routes)
+            return Response(405 if known else 404)
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.exception("HTTP handler %s %s failed: %s", request.method, request.path, e)
+            return Response(500)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    parsed = await asyncio.wait_for(_read_request(reader), _READ_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                if isinstance(parsed, Response):
+                    writer.write(_encode(parsed, keep_alive=False))
+                    await writer.drain()
+                    break
+
+                response = await self._dispatch(parsed)
+                keep_alive = parsed.headers.get("connection", "").lower() != "close"
+                writer.write(_encode(response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def start(self, host: str, port: int):
+        self._server = await asyncio.start_server(
+            self._handle_connection, host, port, limit=_MAX_HEADER_BYTES
+        )
+        logger.info("HTTP server listening on %s:%d", host, port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Простаивающие keep-alive соединения закрываем сами и ждём,
+            # пока обработчики выйдут по EOF, — иначе их отменит остановка цикла
+            tasks = list(self._connections.values())
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Request | Response:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.LimitOverrunError:
+        return Response(413)
+    if len(head) > _MAX_HEADER_BYTES:
+        return Response(413)
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        return Response(400)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        return Response(400)
+    if length > _MAX_BODY_BYTES:
+        return Response(413)
+    body = await reader.readexactly(length) if length else b""
+    return Request(method.upper(), target.split("?", 1)[0], headers, body)
+
+
+def _encode(response: Response, keep_alive: bool) -> bytes:
+    status = response.status
+    head = [
+        f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+        f"Content-Type: {response.content_type}",
+        f"Content-Length: {len(response.body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    head.extend(f"{name}: {value}" for name, value in response.headers.items())
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + response.body
+
+
+# Служебный сервер процесса: /metrics, /health, webhook
+_default = Server()
+add_route = _default.add_route
+start = _default.start
+stop = _default.stop
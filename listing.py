@@ -0,0 +1,121 @@
+# listing.py
+"""
+Постраничный вывод дней рождения для /list_bdays и /list_my_bdays.
+
+Страница читается из базы по ключу (md, id) последней показанной
+записи, поэтому запрос и память не растут с размером чата. В одно
+сообщение попадает не больше LIST_PAGE_SIZE записей и не больше
+лимита Telegram на длину текста; остальное — на следующих страницах,
+куда ведут кнопки ◀️ / ▶️ (callback_data из callback_data()).
+"""
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import MessageLimit
+
+from config import LIST_PAGE_SIZE
+from db_async import list_birthdays_page
+from storage import month_day
+
+CALLBACK_PREFIX = "bdays"
+# Владелец в callback_data для общего списка чата
+ALL = "all"
+
+# Длиннее имя не показываем целиком, чтобы строка точно влезла в сообщение
+_MAX_NAME = 200
+
+_HEADERS = {
+    True: "Твои дни рождения в этом чате:",
+    False: "Список дней рождения:",
+}
+
+
+def _key(row) -> tuple[int, int]:
+    rec_id, _, _, date_str = row
+    _, m, d = date_str.split("-")
+    return month_day(int(m), int(d)), rec_id
+
+
+def _line(row, own: bool) -> str:
+    rec_id, user_id, name, date_str = row
+    _, m, d = date_str.split("-")
+    if len(name) > _MAX_NAME:
+        name = name[:_MAX_NAME] + "…"
+    line = f"{rec_id}: {d}.{m} — {name}"
+    return line if own else f"{line} (user_id={user_id})"
+
+
+def callback_data(owner, direction: str, key: tuple[int, int]) -> str:
+    """owner — user_id или ALL; direction — "n" (дальше) или "p" (назад)."""
+    return f"{CALLBACK_PREFIX}:{owner}:{direction}:{key[0]}:{key[1]}"
+
+
+def parse_callback_data(data: str):
+    """(owner, backward, key) или None, если данные не наши или испорчены."""
+    try:
+        prefix, owner, direction, md, rec_id = data.split(":")
+        if prefix != CALLBACK_PREFIX or direction not in ("n", "p"):
+            return None
+        return (owner if owner == ALL else int(owner)), direction == "p", (int(md), int(rec_id))
+    except ValueError:
+        return None
+
+
+def _fit(lines: list[str], header: str, from_end: bool) -> int:
+    """Сколько строк (с начала или с конца) помещается в одно сообщение."""
+    size = len(header)
+    ordered = reversed(lines) if from_end else lines
+    count = 0
+    for line in ordered:
+        size += 1 + len(line)
+        if size > MessageLimit.MAX_TEXT_LENGTH:
+            break
+        count += 1
+    return count
+
+
+async def render_page(chat_id: int, owner, after=(0, 0), backward: bool = False):
+    """
+    Текст и клавиатура страницы списка чата (owner == ALL) или записей
+    пользователя owner. after — ключ записи, от которой листаем.
+    Возвращает (None, None), если записей нет совсем.
+    """
+    own = owner != ALL
+    user_id = owner if own else None
+    rows = await list_birthdays_page(
+        chat_id, after[0], after[1], LIST_PAGE_SIZE + 1, user_id=user_id, backward=backward
+    )
+
+    if backward:
+        if len(rows) <= LIST_PAGE_SIZE:
+            # Дошли до начала — показываем полную первую страницу
+            return await render_page(chat_id, owner)
+        rows = rows[:LIST_PAGE_SIZE]
+        rows.reverse()
+        has_prev, has_next = True, True
+    else:
+        has_prev = after != (0, 0)
+        has_next = len(rows) > LIST_PAGE_SIZE
+        rows = rows[:LIST_PAGE_SIZE]
+
+    if not rows:
+        if not has_prev:
+            return None, None
+        # Записи в конце списка удалили, пока его листали
+        text = "Дальше записей нет."
+    else:
+        header = _HEADERS[own]
+        lines = [_line(row, own) for row in rows]
+        count = _fit(lines, header, from_end=backward)
+        if count < len(rows):
+            if backward:
+                rows, lines, has_prev = rows[-count:], lines[-count:], True
+            else:
+                rows, lines, has_next = rows[:count], lines[:count], True
+        text = header + "\n" + "\n".join(lines)
+
+    buttons = []
+    if has_prev:
+        first = _key(rows[0]) if rows else after
+        buttons.append(InlineKeyboardButton("◀️", callback_data=callback_data(owner, "p", first)))
+    if has_next:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=callback_data(owner, "n", _key(rows[-1]))))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
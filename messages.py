@@ -0,0 +1,82 @@
+# messages.py
+"""
+Сборка ежедневного сообщения из готовых фрагментов.
+
+Раздел праздников одинаков для всех чатов, поэтому рендерится один раз
+на дату (и заново только после обновления календаря). Раздел дней
+рождения запоминается по (чат, дата, версия данных чата); версия
+растёт при добавлении и удалении записей — см. invalidate.
+"""
+from collections import OrderedDict
+from datetime import date
+
+import holidays
+from greetings import greetings_for, mention_html
+from yandex_gpt import fallback_text
+
+# Сколько разделов дней рождения держать в памяти
+_MAX_BIRTHDAY_SECTIONS = 10_000
+
+# "YYYY-MM-DD" -> (версия календаря, текст раздела или None)
+_holiday_sections: dict[str, tuple[float, str | None]] = {}
+# (chat_id, дата, версия) -> (id записей, текст раздела)
+_birthday_sections: OrderedDict[tuple[int, date, int], tuple[tuple[int, ...], str]] = OrderedDict()
+# chat_id -> версия данных о днях рождения
+_versions: dict[int, int] = {}
+
+
+def invalidate(chat_id: int):
+    """Вызывать после изменения дней рождения чата."""
+    _versions[chat_id] = _versions.get(chat_id, 0) + 1
+
+
+async def holiday_section(day: date) -> str | None:
+    day_str = day.isoformat()
+    entry = _holiday_sections.get(day_str)
+    if entry is not None and entry[0] == holidays.version():
+        return entry[1]
+
+    names = await holidays.get_holidays_async(day_str)
+    text = "🎊 Праздники сегодня:\n" + "\n".join(f"• {h}" for h in names) if names else None
+    if len(_holiday_sections) > 7:
+        # Нужны только сегодняшние даты разных поясов
+        _holiday_sections.clear()
+    _holiday_sections[day_str] = (holidays.version(), text)
+    return text
+
+
+async def birthday_section(chat_id: int, day: date, birthdays) -> str | None:
+    """birthdays — записи (id, user_id, name, date) чата на дату day."""
+    if not birthdays:
+        return None
+    key = (chat_id, day, _versions.get(chat_id, 0))
+    ids = tuple(rec_id for rec_id, _, _, _ in birthdays)
+    entry = _birthday_sections.get(key)
+    # Записи сверяем на случай изменений с другой реплики
+    if entry is not None and entry[0] == ids:
+        _birthday_sections.move_to_end(key)
+        return entry[1]
+
+    lines = await greetings_for(day, birthdays)
+    text = "🎂 Дни рождения сегодня:\n" + "\n".join(lines)
+    if any(
+        line == fallback_text(mention_html(user_id, name))
+        for line, (_, user_id, name, _) in zip(lines, birthdays)
+    ):
+        # Заглушку не запоминаем: при следующей сборке попробуем ещё раз
+        return text
+    _birthday_sections[key] = (ids, text)
+    _birthday_sections.move_to_end(key)
+    while len(_birthday_sections) > _MAX_BIRTHDAY_SECTIONS:
+        _birthday_sections.popitem(last=False)
+    return text
+
+
+async def compose(chat_id: int, day: date, birthdays) -> str | None:
+    """Текст ежедневного сообщения чата или None, если поздравлять нечем."""
+    parts = [
+        part
+        for part in (await holiday_section(day), await birthday_section(chat_id, day, birthdays))
+        if part
+    ]
+    return "\n\n".join(parts) if parts else None
@@ -0,0 +1,185 @@
+# metrics.py
+"""
+Счётчики и гистограммы в текстовом формате Prometheus.
+
+Запись метрики — пара операций со словарём под блокировкой (метрики
+пишут и event loop, и потоки БД), текст собирается только при запросе
+/metrics (см. http_server.py), поэтому без сборщика накладных расходов
+почти нет.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы корзин гистограмм по умолчанию, в секундах
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        lines = self._header()
+        for labels, value in values:
+            lines.append(
+                f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            )
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики корзин..., сумма, количество]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, *labels, value: float):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Замеряет длительность блока with."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - started)
+
+    def counts(self) -> dict[tuple, int]:
+        """Число наблюдений по наборам меток."""
+        with self._lock:
+            return {labels: state[-1] for labels, state in self._values.items()}
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = [(labels, list(state)) for labels, state in self._values.items()]
+        lines = self._header()
+        for labels, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}"
+                )
+            le = 'le="+Inf"'
+            lines.append(
+                f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {state[-1]}"
+            )
+            label_str = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{label_str} {state[-1]}")
+        return lines
+
+
+def render() -> str:
+    """Все метрики процесса в текстовом формате Prometheus 0.0.4."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ==== МЕТРИКИ БОТА ====
+
+SCHEDULER_TICK_SECONDS = Histogram(
+    "bot_scheduler_tick_seconds", "Duration of a scheduler tick (picking due chats)."
+)
+DUE_CHATS = Counter("bot_due_chats_total", "Chats picked for the daily send.")
+DAILY_SEND_SECONDS = Histogram(
+    "bot_daily_send_seconds",
+    "Duration of rendering and queueing messages for one batch of due chats.",
+)
+DAILY_SEND_CHATS = Counter(
+    "bot_daily_send_chats_total", "Chats processed by the daily send.", ["result"]
+)
+OUTBOX_MESSAGES = Counter(
+    "bot_outbox_messages_total", "Delivery attempts of queued daily messages.", ["result"]
+)
+UPDATE_SECONDS = Histogram(
+    "bot_update_seconds", "Time to handle one Telegram update.", ["kind"]
+)
+DB_SECONDS = Histogram("bot_db_operation_seconds", "Duration of db.py operations.", ["op"])
+DB_ERRORS = Counter("bot_db_errors_total", "Failed db.py operations.", ["op"])
+HTTP_SECONDS = Histogram(
+    "bot_http_request_seconds", "Outgoing HTTP request duration.", ["host", "method"]
+)
+HTTP_ERRORS = Counter(
+    "bot_http_errors_total", "Failed outgoing HTTP requests.", ["host", "method"]
+)
+UPSTREAM_STATE = Gauge(
+    "bot_upstream_circuit_open", "1 if the circuit breaker of an external API is not closed.",
+    ["upstream"],
+)
+SEND_SECONDS = Histogram(
+    "bot_telegram_send_seconds", "Duration of send_message including retries."
+)
+SEND_RESULTS = Counter(
+    "bot_telegram_send_total", "send_message outcomes.", ["result"]
+)
+SEND_RETRIES = Counter(
+    "bot_telegram_send_retries_total", "send_message retries.", ["reason"]
+)
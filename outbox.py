@@ -0,0 +1,149 @@
+# outbox.py
+"""
+Доставка ежедневных сообщений из очереди в базе (таблица outbox).
+
+Рассылка только готовит тексты и ставит их в очередь вместе с
+отметкой mark_sent (см. handlers._deliver), а отправляет их отдельная
+задача: берёт в аренду пачку OUTBOX_BATCH сообщений, отправляет через
+dispatch (лимиты Telegram и короткие повторы там) и одной транзакцией
+записывает итог. Сообщение, которое не ушло, откладывается с
+удваивающейся паузой; после OUTBOX_MAX_ATTEMPTS попыток или ошибки,
+которую повтор не исправит (бота удалили из чата), оно помечается
+failed.
+
+Очередь переживает рестарт: при старте воркер снимает свои аренды и
+досылает оставшееся. Доставка «хотя бы один раз» — если процесс упал
+между отправкой и записью итога, сообщение уйдёт повторно.
+"""
+import asyncio
+import logging
+import random
+import time
+
+from telegram.error import BadRequest, Forbidden
+
+import dispatch
+from config import (
+    OUTBOX_BATCH,
+    OUTBOX_LEASE_SECONDS,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_RETRY_SECONDS,
+    WORKER_ID,
+)
+from db_async import claim_outbox, complete_outbox, get_outbox_backlog, release_outbox
+from metrics import OUTBOX_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать, пока текущая пачка доотправится при остановке
+_STOP_TIMEOUT = 10
+# Не чаще раза в столько секунд опрашиваем очередь без сигнала wake
+_MIN_IDLE_WAIT = 1.0
+
+_task: asyncio.Task | None = None
+_wakeup: asyncio.Event | None = None
+_stopping = False
+
+
+def wake():
+    """Сигнал, что в очереди появились сообщения (вызывать из event loop)."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def _retry_delay(attempts: int) -> float:
+    # Полный джиттер, как у resilience.Upstream: повторы разных сообщений
+    # не совпадают по времени
+    return random.uniform(0, OUTBOX_RETRY_SECONDS * 2 ** attempts)
+
+
+async def _send_batch(bot, batch):
+    sent, retry, failed = [], [], []
+
+    async def send(item):
+        outbox_id, chat_id, text, attempts = item
+        try:
+            await dispatch.send_message(
+                bot, chat_id, text, parse_mode="HTML", disable_web_page_preview=True
+            )
+        except (BadRequest, Forbidden) as e:
+            logger.warning("Daily message to %s dropped: %s", chat_id, e)
+            failed.append((outbox_id, str(e)))
+        except Exception as e:
+            logger.warning("Daily message to %s failed (attempt %d): %s", chat_id, attempts + 1, e)
+            if attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+                failed.append((outbox_id, str(e)))
+            else:
+                retry.append((outbox_id, time.time() + _retry_delay(attempts), str(e)))
+        else:
+            sent.append(outbox_id)
+
+    await dispatch.fan_out(batch, send)
+    await complete_outbox(sent, retry, failed, time.time())
+    OUTBOX_MESSAGES.inc("sent", amount=len(sent))
+    OUTBOX_MESSAGES.inc("retry", amount=len(retry))
+    OUTBOX_MESSAGES.inc("failed", amount=len(failed))
+    logger.info(
+        "Outbox batch: %d sent, %d postponed, %d failed", len(sent), len(retry), len(failed)
+    )
+
+
+async def _idle_wait():
+    """Ждёт сигнала wake, ближайшей повторной попытки или OUTBOX_POLL_INTERVAL."""
+    _, next_at = await get_outbox_backlog()
+    timeout = OUTBOX_POLL_INTERVAL
+    if next_at is not None:
+        timeout = min(timeout, max(_MIN_IDLE_WAIT, next_at - time.time()))
+    try:
+        await asyncio.wait_for(_wakeup.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    _wakeup.clear()
+
+
+async def _drain(bot):
+    await release_outbox(WORKER_ID)
+    while not _stopping:
+        try:
+            batch = await claim_outbox(WORKER_ID, time.time(), OUTBOX_LEASE_SECONDS, OUTBOX_BATCH)
+            if batch:
+                await _send_batch(bot, batch)
+            else:
+                await _idle_wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Сбой базы не должен останавливать доставку навсегда
+            logger.exception("Outbox drain failed: %s", e)
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+def start(bot):
+    global _task, _wakeup, _stopping
+    _stopping = False
+    _wakeup = asyncio.Event()
+    _task = asyncio.create_task(_drain(bot), name="outbox")
+
+
+async def stop():
+    """Даёт доотправить текущую пачку и останавливает доставку."""
+    global _task, _stopping
+    if _task is None:
+        return
+    _stopping = True
+    wake()
+    try:
+        await asyncio.wait_for(_task, _STOP_TIMEOUT)
+    except asyncio.TimeoutError:
+        # Аренда недоставленных истечёт, и их отправит следующий запуск
+        pass
+    except Exception as e:
+        logger.exception("Outbox stopped with error: %s", e)
+    _task = None
+
+
+async def backlog() -> dict:
+    """Для /health: сколько сообщений ждёт отправки."""
+    pending, next_at = await get_outbox_backlog()
+    return {"pending": pending, "next_attempt": next_at}
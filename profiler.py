@@ -0,0 +1,77 @@
+# profiler.py
+"""
+Выборочный профилировщик по запросу: /profile у владельца бота или
+сигнал SIGUSR1.
+
+Отдельный поток каждые PROFILE_INTERVAL секунд снимает стеки всех
+потоков процесса (sys._current_frames) и считает одинаковые стеки.
+Результат пишется в PROFILE_DIR в «свёрнутом» формате
+(поток;функция;...;функция число) — его понимают flamegraph.pl и
+speedscope. Накладные расходы есть только во время записи профиля.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from config import PROFILE_DIR, PROFILE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample(stacks: Counter, names: dict[int, str], own_id: int):
+    for thread_id, frame in sys._current_frames().items():
+        if thread_id == own_id:
+            continue
+        stack = []
+        while frame is not None:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        stack.append(names.get(thread_id, str(thread_id)))
+        stacks[";".join(reversed(stack))] += 1
+
+
+def record(seconds: float) -> tuple[str, int] | None:
+    """
+    Профилирует процесс seconds секунд (блокирует вызывающий поток).
+    Возвращает (путь к файлу, число выборок) или None, если профиль
+    уже пишется.
+    """
+    if not _lock.acquire(blocking=False):
+        return None
+    try:
+        own_id = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            _sample(stacks, names, own_id)
+            samples += 1
+            time.sleep(PROFILE_INTERVAL)
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info("Profile written to %s (%d samples)", path, samples)
+        return path, samples
+    finally:
+        _lock.release()
+
+
+def start_in_background(seconds: float):
+    """Для обработчика сигнала: профиль в отдельном потоке, без ответа в чат."""
+    threading.Thread(
+        target=record, args=(seconds,), name="profiler", daemon=True
+    ).start()
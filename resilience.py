@@ -0,0 +1,197 @@
+# resilience.py
+"""
+Защита от деградации внешних API (календарь, YandexGPT).
+
+Upstream оборачивает вызовы к одному сервису:
+- предохранитель (circuit breaker): после UPSTREAM_FAILURE_THRESHOLD
+  сбоев подряд вызовы сразу падают с CircuitOpen, и вызывающий код
+  берёт кэш или заглушку; через UPSTREAM_RESET_SECONDS один пробный
+  запрос проверяет, ожил ли сервис;
+- таймаут по наблюдаемой задержке: p95 с запасом, но не больше
+  исходного таймаута;
+- ограниченные повторы с экспоненциальной паузой и джиттером;
+- для идемпотентных GET — дублирующий (hedged) запрос, если ответа
+  нет дольше обычного.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+import httpx
+
+from config import (
+    UPSTREAM_FAILURE_THRESHOLD,
+    UPSTREAM_MAX_ATTEMPTS,
+    UPSTREAM_RESET_SECONDS,
+)
+from metrics import UPSTREAM_STATE
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Сколько последних задержек учитывать и сколько нужно для оценки
+_WINDOW = 200
+_MIN_SAMPLES = 20
+
+
+class CircuitOpen(Exception):
+    """Предохранитель разомкнут: сервис недавно не отвечал."""
+
+
+def _is_failure(exc: BaseException) -> bool:
+    """Сбой сервиса (а не ошибка запроса): сеть, таймаут, 5xx и 429."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(exc, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class Upstream:
+    def __init__(self, name: str, timeout: float, min_timeout: float = 0.5):
+        self.name = name
+        self.max_timeout = timeout
+        self.min_timeout = min_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._latencies: deque[float] = deque(maxlen=_WINDOW)
+        UPSTREAM_STATE.set(name, value=0)
+
+    # ==== ЗАДЕРЖКИ ====
+
+    def _percentile(self, q: float) -> float | None:
+        if len(self._latencies) < _MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def timeout(self) -> float:
+        p95 = self._percentile(0.95)
+        if p95 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p95 * 3))
+
+    def hedge_delay(self) -> float:
+        p90 = self._percentile(0.9)
+        return self.timeout() / 2 if p90 is None else p90
+
+    # ==== ПРЕДОХРАНИТЕЛЬ ====
+
+    def _set_state(self, state: str):
+        self.state = state
+        UPSTREAM_STATE.set(self.name, value=0 if state == CLOSED else 1)
+
+    def _acquire(self):
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < UPSTREAM_RESET_SECONDS:
+                raise CircuitOpen(self.name)
+            self._set_state(HALF_OPEN)
+            logger.info("Upstream %s: half-open, probing", self.name)
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpen(self.name)
+            self._probe_in_flight = True
+
+    def _on_success(self, latency: float):
+        self._latencies.append(latency)
+        self._probe_in_flight = False
+        if self.state != CLOSED:
+            logger.info("Upstream %s: closed", self.name)
+        self._set_state(CLOSED)
+        self.failures = 0
+
+    def _on_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= UPSTREAM_FAILURE_THRESHOLD:
+            if self.state != OPEN:
+                logger.warning(
+                    "Upstream %s: open after %d failures", self.name, self.failures
+                )
+            self._set_state(OPEN)
+            self._opened_at = time.monotonic()
+
+    def _on_error(self):
+        # Ошибка запроса (4xx и т.п.) не говорит о здоровье сервиса
+        self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        p50 = self._percentile(0.5)
+        p95 = self._percentile(0.95)
+        return {
+            "name": self.name,
+            "state": self.state,
+            "failures": self.failures,
+            "timeout": round(self.timeout(), 3),
+            "p50": None if p50 is None else round(p50, 3),
+            "p95": None if p95 is None else round(p95, 3),
+        }
+
+    # ==== ВЫЗОВЫ ====
+
+    async def _attempt(self, request, hedge: bool):
+        """request(timeout) -> awaitable. Возвращает результат первого успешного запроса."""
+        timeout = self.timeout()
+        if not hedge:
+            return await request(timeout)
+
+        first = asyncio.ensure_future(request(timeout))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay())
+        if done:
+            return first.result()
+
+        second = asyncio.ensure_future(request(timeout))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, request, hedge: bool = False):
+        """
+        Выполняет request(timeout) с предохранителем и повторами.
+        Бросает CircuitOpen, если сервис недавно не отвечал.
+        """
+        for attempt in range(1, UPSTREAM_MAX_ATTEMPTS + 1):
+            self._acquire()
+            started = time.monotonic()
+            try:
+                result = await self._attempt(request, hedge)
+            except asyncio.CancelledError:
+                self._probe_in_flight = False
+                raise
+            except Exception as e:
+                if not _is_failure(e):
+                    self._on_error()
+                    raise
+                self._on_failure()
+                if attempt == UPSTREAM_MAX_ATTEMPTS or self.state == OPEN:
+                    raise
+                # Полный джиттер: повторы разных вызовов не совпадают по времени
+                await asyncio.sleep(random.uniform(0, 0.2 * 2 ** attempt))
+            else:
+                self._on_success(time.monotonic() - started)
+                return result
+
+
+calendar_api = Upstream("calendar", timeout=5)
+llm_api = Upstream("yandex_gpt", timeout=10, min_timeout=2)
+
+
+def snapshot() -> list[dict]:
+    """Состояние предохранителей всех внешних API."""
+    return [calendar_api.snapshot(), llm_api.snapshot()]
@@ -0,0 +1,289 @@
+# schedule.py
+"""
+Индекс расписания в памяти.
+
+- минута суток по UTC -> включённые чаты (для выборки по времени);
+- куча (момент срабатывания, chat_id) — ближайшая рассылка по всем чатам,
+  по ней планировщик спит ровно до нужного момента.
+
+У каждого чата своё время и часовой пояс. Смещение пояса от UTC
+считается заранее (при смене пояса и раз в сутки), поэтому здесь
+нет преобразований часовых поясов — только сложение минут.
+
+Загружается при старте из таблицы chats и поддерживается в актуальном
+состоянии функциями db.register_chat / set_chat_enabled / set_chat_time /
+set_chat_tz; изменения с других воркеров приносит update.
+"""
+import heapq
+import threading
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from config import DEFAULT_TZ
+
+_lock = threading.Lock()
+# chat_id -> (enabled, местная минута суток, смещение от UTC в минутах)
+_chats: dict[int, tuple[bool, int, int]] = {}
+# минута суток по UTC -> chat_id включённых чатов
+_buckets: dict[int, set[int]] = {}
+# chat_id -> местная дата последней рассылки (или начатой сейчас)
+_last_sent: dict[int, date] = {}
+# (unix-время срабатывания, chat_id, поколение); устаревшие записи
+# пропускаются лениво по несовпадению поколения
+_heap: list[tuple[float, int, int]] = []
+_generation: dict[int, int] = {}
+# chat_id -> (unix-время, местная дата) повторной рассылки после сбоя
+# подготовки сообщения (retry); переживает перепланирование чата
+_retries: dict[int, tuple[float, date]] = {}
+_listener = None
+
+
+def minute_of_day(hour: int, minute: int) -> int:
+    return hour * 60 + minute
+
+
+def utc_minute(slot: int, offset: int) -> int:
+    """Местная минута суток -> минута суток по UTC."""
+    return (slot - offset) % 1440
+
+
+def utc_offset(tz_name: str | None, at: datetime | None = None) -> int:
+    """
+    Смещение пояса от UTC в минутах на момент at (по умолчанию сейчас).
+    None — пояс по умолчанию (DEFAULT_TZ или пояс сервера).
+    """
+    at = at or datetime.now(timezone.utc)
+    tz_name = tz_name or DEFAULT_TZ
+    if tz_name:
+        offset = at.astimezone(ZoneInfo(tz_name)).utcoffset()
+    else:
+        offset = at.astimezone().utcoffset()
+    return int(offset.total_seconds() // 60)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _local_date(moment: datetime, offset: int) -> date:
+    return (moment + timedelta(minutes=offset)).date()
+
+
+def _fire_at(day: date, slot: int, offset: int) -> datetime:
+    midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return midnight + timedelta(minutes=slot - offset)
+
+
+def _next_fire(chat_id: int, slot: int, offset: int, now: datetime, catch_up: bool) -> datetime:
+    """
+    Ближайший момент рассылки. Сегодняшняя (по местной дате чата) уже
+    прошедшая минута досылается сразу только при catch_up (после
+    рестарта), если за сегодня сообщение ещё не отправлено.
+    """
+    today = _local_date(now, offset)
+    fire = _fire_at(today, slot, offset)
+    sent_today = _last_sent.get(chat_id, date.min) >= today
+    if sent_today:
+        return _fire_at(today + timedelta(days=1), slot, offset)
+    if fire >= now.replace(second=0, microsecond=0):
+        return fire
+    if catch_up:
+        return now
+    return _fire_at(today + timedelta(days=1), slot, offset)
+
+
+def _unlink(chat_id: int):
+    prev = _chats.pop(chat_id, None)
+    if prev is None:
+        return
+    enabled, slot, offset = prev
+    if enabled:
+        key = utc_minute(slot, offset)
+        bucket = _buckets.get(key)
+        if bucket is not None:
+            bucket.discard(chat_id)
+            if not bucket:
+                del _buckets[key]
+
+
+def _link(chat_id: int, enabled: bool, slot: int, offset: int, now: datetime, catch_up: bool = False):
+    _chats[chat_id] = (enabled, slot, offset)
+    generation = _generation.get(chat_id, 0) + 1
+    _generation[chat_id] = generation
+    if enabled:
+        _buckets.setdefault(utc_minute(slot, offset), set()).add(chat_id)
+        fire = _next_fire(chat_id, slot, offset, now, catch_up)
+        heapq.heappush(_heap, (fire.timestamp(), chat_id, generation))
+    pending = _retries.get(chat_id)
+    if pending is not None:
+        at, day = pending
+        # Повтор остаётся в силе, пока чат включён и у него не кончились те сутки
+        if enabled and _local_date(datetime.fromtimestamp(at, timezone.utc), offset) == day:
+            heapq.heappush(_heap, (at, chat_id, generation))
+        else:
+            del _retries[chat_id]
+
+
+def _notify():
+    if _listener is not None:
+        _listener()
+
+
+def set_listener(callback):
+    """callback() вызывается после изменения расписания (из любого потока)."""
+    global _listener
+    _listener = callback
+
+
+def load(rows, catch_up: bool = True):
+    """
+    rows: итерируемое (chat_id, enabled, местная минута суток,
+    смещение от UTC, дата последней рассылки).
+    """
+    now = _now()
+    with _lock:
+        # Даты начатых в этом процессе рассылок могут быть новее, чем в базе
+        last_sent = dict(_last_sent)
+        _chats.clear()
+        _buckets.clear()
+        _last_sent.clear()
+        _heap.clear()
+        for chat_id, enabled, slot, offset, sent in rows:
+            known = last_sent.get(chat_id)
+            if sent:
+                sent = date.fromisoformat(sent)
+                known = max(known, sent) if known else sent
+            if known:
+                _last_sent[chat_id] = known
+            _link(chat_id, bool(enabled), slot, offset, now, catch_up=catch_up)
+        for chat_id in [chat_id for chat_id in _retries if chat_id not in _chats]:
+            del _retries[chat_id]
+    _notify()
+
+
+def update(rows):
+    """
+    Применяет изменённые строки чатов (в формате load) к индексу без его
+    пересборки. Прошедшие сегодня минуты не досылаются (как catch_up=False).
+    """
+    now = _now()
+    with _lock:
+        for chat_id, enabled, slot, offset, sent in rows:
+            advanced = False
+            if sent:
+                sent = date.fromisoformat(sent)
+                if sent > _last_sent.get(chat_id, date.min):
+                    _last_sent[chat_id] = sent
+                    advanced = True
+            if not advanced and _chats.get(chat_id) == (bool(enabled), slot, offset):
+                continue
+            _unlink(chat_id)
+            _link(chat_id, bool(enabled), slot, offset, now)
+    _notify()
+
+
+def add_chat(chat_id: int, enabled: bool, slot: int, offset: int):
+    with _lock:
+        if chat_id in _chats:
+            return
+        _link(chat_id, enabled, slot, offset, _now())
+    _notify()
+
+
+def set_enabled(chat_id: int, enabled: bool):
+    with _lock:
+        prev = _chats.get(chat_id)
+        if prev is None:
+            return
+        _unlink(chat_id)
+        _link(chat_id, enabled, prev[1], prev[2], _now())
+    _notify()
+
+
+def set_slot(chat_id: int, slot: int):
+    with _lock:
+        prev = _chats.get(chat_id)
+        if prev is None:
+            return
+        _unlink(chat_id)
+        _link(chat_id, prev[0], slot, prev[2], _now())
+    _notify()
+
+
+def set_offset(chat_id: int, offset: int):
+    with _lock:
+        prev = _chats.get(chat_id)
+        if prev is None:
+            return
+        _unlink(chat_id)
+        _link(chat_id, prev[0], prev[1], offset, _now())
+    _notify()
+
+
+def local_today(chat_id: int) -> date:
+    """Текущая дата в поясе чата."""
+    return local_date(chat_id, _now())
+
+
+def local_date(chat_id: int, moment: datetime) -> date:
+    """Дата в поясе чата в момент moment (aware datetime)."""
+    with _lock:
+        prev = _chats.get(chat_id)
+    offset = prev[2] if prev else utc_offset(None)
+    return _local_date(moment, offset)
+
+
+def due_chats_utc(minute: int) -> list[int]:
+    """Включённые чаты, у которых рассылка в минуту суток minute по UTC."""
+    with _lock:
+        return list(_buckets.get(minute, ()))
+
+
+def retry(chat_id: int, day: date, at: datetime) -> bool:
+    """
+    Повторная рассылка чату за местную дату day в момент at (после сбоя
+    подготовки сообщения). False — чат выключен или at уже в следующих
+    сутках чата.
+    """
+    with _lock:
+        prev = _chats.get(chat_id)
+        if prev is None or not prev[0] or _local_date(at, prev[2]) != day:
+            return False
+        _retries[chat_id] = (at.timestamp(), day)
+        # То же поколение: срабатывание из pop_due перепланирует чат как обычно
+        heapq.heappush(_heap, (at.timestamp(), chat_id, _generation[chat_id]))
+    _notify()
+    return True
+
+
+def next_fire() -> datetime | None:
+    """Ближайший момент рассылки по всем чатам."""
+    with _lock:
+        while _heap:
+            fire_ts, chat_id, generation = _heap[0]
+            if _generation.get(chat_id) == generation:
+                return datetime.fromtimestamp(fire_ts, timezone.utc)
+            heapq.heappop(_heap)
+    return None
+
+
+def pop_due(now: datetime | None = None) -> list[tuple[int, date]]:
+    """
+    Забирает чаты, которым пора слать, и сразу планирует их на завтра.
+    Возвращает [(chat_id, местная дата рассылки), ...].
+    """
+    now = now or _now()
+    due = []
+    with _lock:
+        while _heap and _heap[0][0] <= now.timestamp():
+            fire_ts, chat_id, generation = heapq.heappop(_heap)
+            if _generation.get(chat_id) != generation:
+                continue
+            enabled, slot, offset = _chats[chat_id]
+            day = _local_date(datetime.fromtimestamp(fire_ts, timezone.utc), offset)
+            due.append((chat_id, day))
+            # Рассылка начата: повторно за этот день не планируем
+            _last_sent[chat_id] = day
+            _retries.pop(chat_id, None)
+            _link(chat_id, enabled, slot, offset, now)
+    return due
@@ -0,0 +1,64 @@
+# scheduler.py
+"""
+Событийный планировщик ежедневных рассылок.
+
+Вместо опроса раз в минуту держим одно задание JobQueue на ближайший
+момент из кучи schedule и переставляем его при каждом изменении
+расписания (/time, /enable, /disable, новый чат).
+"""
+import asyncio
+import logging
+
+import schedule
+
+logger = logging.getLogger(__name__)
+
+_job_queue = None
+_callback = None
+_loop: asyncio.AbstractEventLoop | None = None
+_job = None
+
+
+async def _tick(context):
+    global _job
+    # Задание уже сработало и снято APScheduler
+    _job = None
+    try:
+        await _callback(context)
+    finally:
+        rearm()
+
+
+def start(job_queue, callback):
+    """callback — корутина-задание JobQueue, обрабатывающая schedule.pop_due()."""
+    global _job_queue, _callback, _loop
+    _job_queue = job_queue
+    _callback = callback
+    _loop = asyncio.get_running_loop()
+    # Изменения приходят из потока БД — переставляем задание в event loop
+    schedule.set_listener(lambda: _loop.call_soon_threadsafe(rearm))
+    rearm()
+
+
+def rearm():
+    """Планирует задание на ближайший момент рассылки."""
+    global _job
+    if _job_queue is None:
+        return
+    when = schedule.next_fire()
+    if _job is not None:
+        if when is not None and _job.next_t == when:
+            return
+        _job.schedule_removal()
+        _job = None
+    if when is None:
+        return
+    _job = _job_queue.run_once(
+        _tick,
+        when=when,
+        name="scheduler_tick",
+        # Момент может быть уже в прошлом (догоняем после рестарта) —
+        # APScheduler не должен считать такое срабатывание пропущенным
+        job_kwargs={"misfire_grace_time": None},
+    )
+    logger.debug("Next daily send at %s", when.isoformat())
@@ -0,0 +1,66 @@
+# sharding.py
+"""
+Распределение чатов между воркерами.
+
+Владелец чата определяется консистентным хешированием chat_id по кольцу
+живых воркеров (WORKER_ID из 0..WORKER_COUNT-1, живые — по пульсу
+в таблице workers). Когда воркер пропадает, на другие уходят только
+его чаты. От двойной отправки при смене владельца защищают аренды
+рассылок в базе (db.claim_sends).
+"""
+import bisect
+import hashlib
+
+from config import WORKER_COUNT, WORKER_ID
+
+# Виртуальных узлов на воркер: ровнее делит чаты между воркерами
+_VNODES = 64
+
+_live: frozenset[int] = frozenset()
+# Отсортированные точки кольца и воркеры в них
+_points: list[int] = []
+_owners: list[int] = []
+
+
+def enabled() -> bool:
+    return WORKER_COUNT > 1
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def set_live_workers(workers):
+    """Перестраивает кольцо по живым воркерам (текущий считается живым всегда)."""
+    global _live, _points, _owners
+    live = frozenset(w for w in workers if 0 <= w < WORKER_COUNT) | {WORKER_ID}
+    if live == _live:
+        return
+    ring = sorted((_hash(f"worker-{w}-{i}"), w) for w in live for i in range(_VNODES))
+    _live = live
+    _points = [point for point, _ in ring]
+    _owners = [worker for _, worker in ring]
+
+
+def live_workers() -> frozenset[int]:
+    return _live
+
+
+def owner(chat_id: int) -> int:
+    if not enabled():
+        return WORKER_ID
+    i = bisect.bisect(_points, _hash(str(chat_id))) % len(_points)
+    return _owners[i]
+
+
+def owns(chat_id: int) -> bool:
+    return owner(chat_id) == WORKER_ID
+
+
+def receives_updates() -> bool:
+    """Апдейты long polling может получать только один процесс — нулевой воркер."""
+    return WORKER_ID == 0
+
+
+# До первого пульса считаем живыми всех настроенных воркеров
+set_live_workers(range(WORKER_COUNT))
@@ -0,0 +1,658 @@
+# storage.py
+"""
+Контракт хранилища дней рождения и чатов.
+
+Методы Storage повторяют функции db.py. SQL здесь общий для SQLite
+и PostgreSQL (плейсхолдеры «?»); наследники отвечают за соединения,
+миграции и диалектные запросы.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import schedule
+
+
+def month_day(month: int, day: int) -> int:
+    """Компактный ключ дня рождения для колонки birthdays.md."""
+    return month * 100 + day
+
+
+def passed_today(chats, now: datetime):
+    """
+    [(местная дата, chat_id), ...] для чатов (chat_id, местная минута
+    суток, смещение от UTC), у которых сегодня время рассылки уже прошло.
+    now — aware datetime.
+    """
+    result = []
+    for chat_id, slot, offset in chats:
+        local = now + timedelta(minutes=offset or 0)
+        if local.hour * 60 + local.minute >= slot:
+            result.append((local.date().isoformat(), chat_id))
+    return result
+
+
+def migrate_backfill_last_sent(cur, defaults):
+    # Чаты без даты последней рассылки, чьё время сегодня уже прошло, до
+    # обновления поздравила прежняя версия бота: без даты досылка после
+    # рестарта (schedule.load с catch_up) отправила бы им сообщение повторно
+    cur.execute(
+        "SELECT chat_id, send_minute, utc_offset FROM chats WHERE last_sent_date IS NULL"
+    )
+    cur.executemany(
+        "UPDATE chats SET last_sent_date = ? WHERE chat_id = ?",
+        passed_today(cur.fetchall(), datetime.now(timezone.utc)),
+    )
+
+
+class Storage:
+    # Сколько потоков db_async может одновременно отдавать хранилищу
+    max_workers = 1
+
+    def __init__(self):
+        self._local = threading.local()
+
+    # ==== СОЕДИНЕНИЯ (реализуют наследники) ====
+
+    @contextmanager
+    def _connect(self):
+        """Соединение, закреплённое за текущей транзакцией."""
+        raise NotImplementedError
+
+    def _cursor(self, conn):
+        return conn.cursor()
+
+    def _begin(self, conn):
+        pass
+
+    def _commit(self, conn):
+        conn.commit()
+
+    def _rollback(self, conn):
+        conn.rollback()
+
+    def migrate(self, default_hour: int, default_minute: int):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    # ==== ТРАНЗАКЦИИ ====
+
+    @contextmanager
+    def transaction(self):
+        """
+        Транзакция с одним COMMIT. Вложенные вызовы (в том числе методы
+        хранилища внутри with transaction()) присоединяются к внешней.
+        """
+        state = self._local
+        if getattr(state, "cursor", None) is not None:
+            yield state.cursor
+            return
+
+        with self._connect() as conn:
+            self._begin(conn)
+            state.cursor = self._cursor(conn)
+            state.after_commit = []
+            try:
+                yield state.cursor
+            except BaseException:
+                self._rollback(conn)
+                raise
+            else:
+                self._commit(conn)
+                callbacks = state.after_commit
+            finally:
+                state.cursor = None
+                state.after_commit = []
+
+        for callback in callbacks:
+            callback()
+
+    def _read(self):
+        return self.transaction()
+
+    def on_commit(self, callback):
+        """Выполнить callback после фиксации текущей транзакции (вызывать внутри неё)."""
+        self._local.after_commit.append(callback)
+
+    # ==== ЧАТЫ ====
+
+    def register_chat(self, chat_id: int, default_hour: int, default_minute: int) -> bool:
+        """Добавляет чат с настройками по умолчанию; True, если его ещё не было."""
+        slot = schedule.minute_of_day(default_hour, default_minute)
+        offset = schedule.utc_offset(None)
+        with self.transaction() as cur:
+            cur.execute(
+                """
+                INSERT INTO chats (
+                    chat_id, enabled, hour, minute, send_minute, utc_offset, send_minute_utc, updated_at
+                )
+                VALUES (?, 1, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (chat_id) DO NOTHING
+                """,
+                (chat_id, default_hour, default_minute, slot, offset,
+                 schedule.utc_minute(slot, offset), time.time()),
+            )
+            created = cur.rowcount > 0
+            if created:
+                self.on_commit(lambda: schedule.add_chat(chat_id, True, slot, offset))
+        return created
+
+    def chat_exists(self, chat_id: int) -> bool:
+        with self._read() as cur:
+            cur.execute("SELECT 1 FROM chats WHERE chat_id = ? LIMIT 1", (chat_id,))
+            row = cur.fetchone()
+        return row is not None
+
+    def set_chat_enabled(self, chat_id: int, enabled: bool):
+        with self.transaction() as cur:
+            cur.execute(
+                "UPDATE chats SET enabled = ?, updated_at = ? WHERE chat_id = ?",
+                (1 if enabled else 0, time.time(), chat_id),
+            )
+            self.on_commit(lambda: schedule.set_enabled(chat_id, enabled))
+
+    def set_chat_time(self, chat_id: int, hour: int, minute: int):
+        slot = schedule.minute_of_day(hour, minute)
+        with self.transaction() as cur:
+            cur.execute(
+                """
+                UPDATE chats
+                SET hour = ?, minute = ?, send_minute = ?,
+                    send_minute_utc = ((? - utc_offset) % 1440 + 1440) % 1440,
+                    updated_at = ?
+                WHERE chat_id = ?
+                """,
+                (hour, minute, slot, slot, time.time(), chat_id),
+            )
+            self.on_commit(lambda: schedule.set_slot(chat_id, slot))
+
+    def get_chat_tz(self, chat_id: int) -> str | None:
+        with self._read() as cur:
+            cur.execute("SELECT tz FROM chats WHERE chat_id = ?", (chat_id,))
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def set_chat_tz(self, chat_id: int, tz_name: str | None):
+        """tz_name — имя пояса IANA (Europe/Moscow) или None для пояса по умолчанию."""
+        offset = schedule.utc_offset(tz_name)
+        with self.transaction() as cur:
+            cur.execute(
+                """
+                UPDATE chats
+                SET tz = ?, utc_offset = ?,
+                    send_minute_utc = ((send_minute - ?) % 1440 + 1440) % 1440,
+                    updated_at = ?
+                WHERE chat_id = ?
+                """,
+                (tz_name, offset, offset, time.time(), chat_id),
+            )
+            self.on_commit(lambda: schedule.set_offset(chat_id, offset))
+
+    def refresh_utc_offsets(self) -> bool:
+        """
+        Пересчитывает смещения поясов (переход на летнее время и т.п.).
+        Возвращает True, если что-то изменилось.
+        """
+        changed = False
+        with self.transaction() as cur:
+            cur.execute("SELECT DISTINCT tz, utc_offset FROM chats")
+            for tz_name, old_offset in cur.fetchall():
+                offset = schedule.utc_offset(tz_name)
+                if offset == old_offset:
+                    continue
+                changed = True
+                tz_filter = "tz = ?" if tz_name is not None else "tz IS NULL"
+                cur.execute(
+                    f"""
+                    UPDATE chats
+                    SET utc_offset = ?,
+                        send_minute_utc = ((send_minute - ?) % 1440 + 1440) % 1440,
+                        updated_at = ?
+                    WHERE {tz_filter} AND utc_offset = ?
+                    """,
+                    (offset, offset, time.time(),
+                     *([tz_name] if tz_name is not None else []), old_offset),
+                )
+        return changed
+
+    def get_chat_slots(self):
+        """
+        (chat_id, enabled, местная минута суток, смещение от UTC,
+        дата последней рассылки) для загрузки индекса расписания.
+        """
+        with self._read() as cur:
+            cur.execute(
+                "SELECT chat_id, enabled, send_minute, utc_offset, last_sent_date FROM chats"
+            )
+            rows = cur.fetchall()
+        return [(row[0], bool(row[1]), row[2], row[3], row[4]) for row in rows]
+
+    def get_chat_slots_changed_since(self, since: float):
+        """
+        То же, что get_chat_slots, только для чатов, чьи настройки или дни
+        рождения менялись позже since (unix-время) — по индексу idx_chats_updated.
+        """
+        with self._read() as cur:
+            cur.execute(
+                """
+                SELECT chat_id, enabled, send_minute, utc_offset, last_sent_date
+                FROM chats WHERE updated_at > ?
+                """,
+                (since,),
+            )
+            rows = cur.fetchall()
+        return [(row[0], bool(row[1]), row[2], row[3], row[4]) for row in rows]
+
+    def mark_sent(self, chat_id: int, day: str):
+        """Запоминает, что ежедневное сообщение за day (YYYY-MM-DD) отправлено."""
+        with self.transaction() as cur:
+            cur.execute(
+                "UPDATE chats SET last_sent_date = ? WHERE chat_id = ?",
+                (day, chat_id),
+            )
+            cur.execute(
+                "UPDATE send_leases SET done = 1 WHERE chat_id = ? AND day = ?",
+                (chat_id, day),
+            )
+
+    def get_all_chats_with_settings(self, default_hour: int, default_minute: int):
+        with self._read() as cur:
+            cur.execute("SELECT chat_id, enabled, hour, minute FROM chats")
+            rows = cur.fetchall()
+
+        chats = []
+        for row in rows:
+            chat_id, enabled, hour, minute = row[0], row[1], row[2], row[3]
+            if hour is None:
+                hour = default_hour
+            if minute is None:
+                minute = default_minute
+            chats.append({
+                "chat_id": chat_id,
+                "enabled": bool(enabled),
+                "hour": int(hour),
+                "minute": int(minute),
+            })
+        return chats
+
+    # ==== ВОРКЕРЫ И АРЕНДЫ РАССЫЛОК ====
+
+    def heartbeat(self, worker_id: int, now: float):
+        with self.transaction() as cur:
+            cur.execute(
+                """
+                INSERT INTO workers (worker_id, heartbeat_at) VALUES (?, ?)
+                ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at
+                """,
+                (worker_id, now),
+            )
+
+    def get_live_workers(self, since: float) -> list[int]:
+        """Воркеры, отметившиеся не раньше since (unix-время)."""
+        with self._read() as cur:
+            cur.execute(
+                "SELECT worker_id FROM workers WHERE heartbeat_at >= ? ORDER BY worker_id",
+                (since,),
+            )
+            rows = cur.fetchall()
+        return [row[0] for row in rows]
+
+    def claim_sends(self, chat_ids, day: str, worker_id: int, now: float, lease_seconds: float):
+        """
+        Берёт в аренду рассылку за day для чатов chat_ids. Удаётся, если
+        рассылка ещё не сделана и не арендована другим воркером (или его
+        аренда истекла). Возвращает chat_id, которые достались worker_id.
+        """
+        claimed = []
+        with self.transaction() as cur:
+            for chat_id in chat_ids:
+                cur.execute(
+                    """
+                    INSERT INTO send_leases (chat_id, day, worker_id, expires_at, done)
+                    VALUES (?, ?, ?, ?, 0)
+                    ON CONFLICT (chat_id, day) DO UPDATE
+                    SET worker_id = excluded.worker_id, expires_at = excluded.expires_at
+                    WHERE send_leases.done = 0
+                      AND (send_leases.expires_at < ? OR send_leases.worker_id = excluded.worker_id)
+                    """,
+                    (chat_id, day, worker_id, now + lease_seconds, now),
+                )
+                if cur.rowcount > 0:
+                    claimed.append(chat_id)
+        return claimed
+
+    def get_unsent_chats(self, chat_ids, day: str) -> list[int]:
+        """Чаты из chat_ids, которым рассылка за day ещё не отправлена."""
+        raise NotImplementedError
+
+    def delete_send_leases_before(self, day: str):
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM send_leases WHERE day < ?", (day,))
+
+    # ==== ИСХОДЯЩИЕ СООБЩЕНИЯ (OUTBOX) ====
+
+    def enqueue_outbox(self, items, now: float):
+        """
+        items: итерируемое (chat_id, day, текст). Сообщение за день в чат
+        ставится один раз: повтор (например, после рестарта) игнорируется.
+        """
+        with self.transaction() as cur:
+            cur.executemany(
+                """
+                INSERT INTO outbox (chat_id, day, text, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (chat_id, day) DO NOTHING
+                """,
+                [(chat_id, day, text, now, now) for chat_id, day, text in items],
+            )
+
+    def claim_outbox(self, worker_id: int, now: float, lease_seconds: float, limit: int):
+        """
+        Берёт в аренду до limit сообщений, которые пора отправить.
+        Возвращает [(id, chat_id, текст, число попыток), ...].
+        """
+        claimed = []
+        with self.transaction() as cur:
+            cur.execute(
+                """
+                SELECT id, chat_id, text, attempts FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= ? AND lease_until < ?
+                ORDER BY next_attempt_at, id LIMIT ?
+                """,
+                (now, now, limit),
+            )
+            for row in cur.fetchall():
+                cur.execute(
+                    """
+                    UPDATE outbox SET worker_id = ?, lease_until = ?
+                    WHERE id = ? AND status = 'pending' AND lease_until < ?
+                    """,
+                    (worker_id, now + lease_seconds, row[0], now),
+                )
+                if cur.rowcount > 0:
+                    claimed.append(tuple(row))
+        return claimed
+
+    def release_outbox(self, worker_id: int):
+        """Снимает аренды worker_id — после рестарта его сообщения берутся сразу."""
+        with self.transaction() as cur:
+            cur.execute(
+                "UPDATE outbox SET lease_until = 0 WHERE status = 'pending' AND worker_id = ?",
+                (worker_id,),
+            )
+
+    def complete_outbox(self, sent, retry, failed, now: float):
+        """
+        Итоги отправки пачки одной транзакцией: sent — id доставленных,
+        retry — (id, момент следующей попытки, ошибка), failed — (id, ошибка)
+        для сообщений, которые больше не пытаемся отправить.
+        """
+        with self.transaction() as cur:
+            cur.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, lease_until = 0 WHERE id = ?",
+                [(now, outbox_id) for outbox_id in sent],
+            )
+            cur.executemany(
+                """
+                UPDATE outbox
+                SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?, lease_until = 0
+                WHERE id = ?
+                """,
+                [(next_at, error, outbox_id) for outbox_id, next_at, error in retry],
+            )
+            cur.executemany(
+                """
+                UPDATE outbox
+                SET status = 'failed', attempts = attempts + 1, last_error = ?, lease_until = 0
+                WHERE id = ?
+                """,
+                [(error, outbox_id) for outbox_id, error in failed],
+            )
+
+    def get_outbox_backlog(self) -> tuple[int, float | None]:
+        """
+        (число неотправленных сообщений, ближайший момент, когда одно из
+        них можно взять): сообщение в чужой аренде доступно не раньше её конца.
+        """
+        with self._read() as cur:
+            cur.execute(
+                """
+                SELECT COUNT(*), MIN(
+                    CASE WHEN lease_until > next_attempt_at THEN lease_until ELSE next_attempt_at END
+                )
+                FROM outbox WHERE status = 'pending'
+                """
+            )
+            row = cur.fetchone()
+        return row[0], row[1]
+
+    def delete_outbox_before(self, day: str):
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM outbox WHERE day < ?", (day,))
+
+    # ==== ДНИ РОЖДЕНИЯ ====
+
+    @staticmethod
+    def _touch_chat(cur, chat_id: int):
+        # Другие воркеры поправят план рассылки чата при синхронизации (dayplan.py)
+        cur.execute("UPDATE chats SET updated_at = ? WHERE chat_id = ?", (time.time(), chat_id))
+
+    def add_birthday(self, user_id: int, chat_id: int, name: str, date_str: str):
+        _, m, d = date_str.split("-")
+        with self.transaction() as cur:
+            cur.execute(
+                "INSERT INTO birthdays (user_id, chat_id, name, date, md) VALUES (?, ?, ?, ?, ?)",
+                (user_id, chat_id, name, date_str, month_day(int(m), int(d))),
+            )
+            self._touch_chat(cur, chat_id)
+
+    def get_birthdays_for_day(self, chat_id: int, month: int, day: int):
+        """(id, user_id, name, date) записей чата с днём рождения month-day."""
+        with self._read() as cur:
+            cur.execute(
+                "SELECT id, user_id, name, date FROM birthdays WHERE chat_id = ? AND md = ? ORDER BY id",
+                (chat_id, month_day(month, day)),
+            )
+            rows = cur.fetchall()
+        return [tuple(row) for row in rows]
+
+    def get_birthdays_for_chats(self, chat_ids, month: int, day: int):
+        """
+        То же, что get_birthdays_for_day, сразу для многих чатов.
+        Возвращает chat_id -> [(id, user_id, name, date), ...] только для чатов с записями.
+        """
+        raise NotImplementedError
+
+    def get_birthdays_for_days(self, mds):
+        """
+        Записи всех чатов с днём рождения в любой из дней mds (ключи
+        month_day) одним проходом по индексу idx_birthdays_md:
+        [(chat_id, md, id, user_id, name, date), ...] по chat_id, id.
+        """
+        mds = list(mds)
+        if not mds:
+            return []
+        placeholders = ",".join("?" * len(mds))
+        with self._read() as cur:
+            cur.execute(
+                f"""
+                SELECT chat_id, md, id, user_id, name, date FROM birthdays
+                WHERE md IN ({placeholders})
+                ORDER BY chat_id, id
+                """,
+                mds,
+            )
+            rows = cur.fetchall()
+        return [tuple(row) for row in rows]
+
+    def list_birthdays(self, chat_id: int):
+        with self._read() as cur:
+            cur.execute(
+                "SELECT id, user_id, name, date FROM birthdays WHERE chat_id = ? ORDER BY md, id",
+                (chat_id,),
+            )
+            rows = cur.fetchall()
+        return [tuple(row) for row in rows]
+
+    def delete_birthday(self, chat_id: int, record_id: int) -> bool:
+        with self.transaction() as cur:
+            cur.execute(
+                "DELETE FROM birthdays WHERE chat_id = ? AND id = ?",
+                (chat_id, record_id),
+            )
+            deleted = cur.rowcount
+            if deleted:
+                self._touch_chat(cur, chat_id)
+        return deleted > 0
+
+    def list_birthdays_page(
+        self, chat_id: int, after_md: int, after_id: int, limit: int,
+        user_id: int | None = None, backward: bool = False,
+    ):
+        """
+        Страница list_birthdays (или list_birthdays_by_user, если задан
+        user_id) после записи с ключом (after_md, after_id) по индексу
+        idx_birthdays_chat_md; первая страница — после (0, 0).
+        backward — записи перед ключом, ближайшие к нему первыми.
+        """
+        op, order = ("<", "DESC") if backward else (">", "ASC")
+        user_filter = "AND user_id = ?" if user_id is not None else ""
+        with self._read() as cur:
+            cur.execute(
+                f"""
+                SELECT id, user_id, name, date FROM birthdays
+                WHERE chat_id = ? {user_filter} AND (md {op} ? OR (md = ? AND id {op} ?))
+                ORDER BY md {order}, id {order} LIMIT ?
+                """,
+                (chat_id, *([user_id] if user_id is not None else []),
+                 after_md, after_md, after_id, limit),
+            )
+            rows = cur.fetchall()
+        return [tuple(row) for row in rows]
+
+    def import_birthdays(self, chat_id: int, user_id: int, rows) -> tuple[int, int]:
+        """
+        Загружает записи (имя, дата YYYY-MM-DD, user_id или None) одной
+        транзакцией. Строка без user_id принадлежит загружающему user_id.
+        Запись с тем же (user_id, имя) обновляется, остальные добавляются:
+        тёзки у разных пользователей — разные люди.
+        Возвращает (добавлено, обновлено).
+        """
+        added, updated = {}, {}
+        with self.transaction() as cur:
+            cur.execute("SELECT DISTINCT user_id, name FROM birthdays WHERE chat_id = ?", (chat_id,))
+            existing = {(row[0], row[1]) for row in cur.fetchall()}
+            for name, date_str, row_user_id in rows:
+                _, m, d = date_str.split("-")
+                md = month_day(int(m), int(d))
+                key = (row_user_id or user_id, name)
+                # Повтор записи в файле — побеждает последняя строка
+                if key in existing:
+                    updated[key] = (date_str, md, chat_id, *key)
+                else:
+                    added[key] = (key[0], chat_id, name, date_str, md)
+            cur.executemany(
+                """
+                UPDATE birthdays SET date = ?, md = ?
+                WHERE chat_id = ? AND user_id = ? AND name = ?
+                """,
+                list(updated.values()),
+            )
+            cur.executemany(
+                "INSERT INTO birthdays (user_id, chat_id, name, date, md) VALUES (?, ?, ?, ?, ?)",
+                list(added.values()),
+            )
+            self._touch_chat(cur, chat_id)
+        return len(added), len(updated)
+
+    def list_birthdays_by_user(self, chat_id: int, user_id: int):
+        with self._read() as cur:
+            cur.execute(
+                "SELECT id, name, date FROM birthdays WHERE chat_id = ? AND user_id = ? ORDER BY md, id",
+                (chat_id, user_id),
+            )
+            rows = cur.fetchall()
+        return [tuple(row) for row in rows]
+
+    def delete_birthday_by_user(self, chat_id: int, user_id: int, record_id: int) -> bool:
+        with self.transaction() as cur:
+            cur.execute(
+                "DELETE FROM birthdays WHERE chat_id = ? AND user_id = ? AND id = ?",
+                (chat_id, user_id, record_id),
+            )
+            deleted = cur.rowcount
+            if deleted:
+                self._touch_chat(cur, chat_id)
+        return deleted > 0
+
+    # ==== ПОЗДРАВЛЕНИЯ ====
+
+    def get_greetings(self, day: str, birthday_ids) -> dict[int, str]:
+        """Сохранённые поздравления на дату YYYY-MM-DD: birthday_id -> текст."""
+        raise NotImplementedError
+
+    def save_greetings(self, day: str, items):
+        """items: итерируемое (birthday_id, текст)."""
+        with self.transaction() as cur:
+            cur.executemany(
+                """
+                INSERT INTO greetings (birthday_id, day, text) VALUES (?, ?, ?)
+                ON CONFLICT (birthday_id, day) DO UPDATE SET text = excluded.text
+                """,
+                [(birthday_id, day, text) for birthday_id, text in items],
+            )
+
+    def delete_greetings_before(self, day: str):
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM greetings WHERE day < ?", (day,))
+
+    # ==== ШАБЛОНЫ ПОЗДРАВЛЕНИЙ ====
+
+    def get_greeting_templates(self, fingerprint: str):
+        """(id, текст) шаблонов для отпечатка промпта, свежие использованные первыми."""
+        with self._read() as cur:
+            cur.execute(
+                """
+                SELECT id, text FROM greeting_templates
+                WHERE fingerprint = ? ORDER BY last_used_at DESC, id DESC
+                """,
+                (fingerprint,),
+            )
+            rows = cur.fetchall()
+        return [tuple(row) for row in rows]
+
+    def add_greeting_templates(self, fingerprint: str, texts, now: float):
+        with self.transaction() as cur:
+            cur.executemany(
+                """
+                INSERT INTO greeting_templates (fingerprint, text, created_at, last_used_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                [(fingerprint, text, now, now) for text in texts],
+            )
+
+    def touch_greeting_templates(self, used):
+        """used: итерируемое (id шаблона, момент последнего использования)."""
+        with self.transaction() as cur:
+            cur.executemany(
+                "UPDATE greeting_templates SET last_used_at = ? WHERE id = ?",
+                [(used_at, template_id) for template_id, used_at in used],
+            )
+
+    def evict_greeting_templates(self, keep: int) -> int:
+        """Оставляет keep недавно использованных шаблонов (LRU), возвращает число удалённых."""
+        with self.transaction() as cur:
+            cur.execute(
+                """
+                DELETE FROM greeting_templates WHERE id NOT IN (
+                    SELECT id FROM greeting_templates
+                    ORDER BY last_used_at DESC, id DESC LIMIT ?
+                )
+                """,
+                (keep,),
+            )
+            deleted = cur.rowcount
+        return max(deleted, 0)
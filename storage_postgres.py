@@ -0,0 +1,343 @@
+# storage_postgres.py
+"""
+PostgreSQL-хранилище для нескольких реплик бота с общей базой.
+
+Соединения берутся из ThreadedConnectionPool, поэтому db_async может
+выполнять запросы в нескольких потоках одновременно.
+"""
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extras import execute_batch, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+import schedule
+from storage import Storage, migrate_backfill_last_sent, month_day
+
+# Любое число, общее для всех реплик: сериализует миграции при одновременном старте
+_MIGRATION_LOCK_ID = 0x62646179
+
+
+# ==== МИГРАЦИИ СХЕМЫ ====
+# Номер последней применённой миграции хранится в таблице schema_version.
+# Новые изменения схемы добавляются в конец MIGRATIONS и не правятся задним числом.
+
+def _migrate_initial(cur, defaults):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS birthdays (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            chat_id BIGINT NOT NULL,
+            name TEXT NOT NULL,
+            date TEXT NOT NULL,
+            md SMALLINT NOT NULL
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id BIGINT PRIMARY KEY,
+            enabled SMALLINT NOT NULL DEFAULT 1,
+            hour SMALLINT,
+            minute SMALLINT,
+            send_minute SMALLINT
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS greetings (
+            birthday_id BIGINT NOT NULL,
+            day TEXT NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (birthday_id, day)
+        )
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chats_schedule ON chats (enabled, send_minute)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_birthdays_chat_md ON birthdays (chat_id, md)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_birthdays_chat_user ON birthdays (chat_id, user_id)"
+    )
+
+
+def _migrate_chat_last_sent(cur, defaults):
+    cur.execute("ALTER TABLE chats ADD COLUMN IF NOT EXISTS last_sent_date TEXT")
+
+
+def _migrate_chat_tz(cur, defaults):
+    offset = schedule.utc_offset(None)
+    cur.execute("ALTER TABLE chats ADD COLUMN IF NOT EXISTS tz TEXT")
+    cur.execute("ALTER TABLE chats ADD COLUMN IF NOT EXISTS utc_offset SMALLINT")
+    cur.execute("ALTER TABLE chats ADD COLUMN IF NOT EXISTS send_minute_utc SMALLINT")
+    cur.execute(
+        """
+        UPDATE chats
+        SET utc_offset = ?,
+            send_minute_utc = ((send_minute - ?) % 1440 + 1440) % 1440
+        WHERE utc_offset IS NULL
+        """,
+        (offset, offset),
+    )
+    cur.execute("DROP INDEX IF EXISTS idx_chats_schedule")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chats_schedule_utc ON chats (enabled, send_minute_utc)"
+    )
+
+
+def _migrate_greeting_templates(cur, defaults):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS greeting_templates (
+            id BIGSERIAL PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at DOUBLE PRECISION NOT NULL,
+            last_used_at DOUBLE PRECISION NOT NULL
+        )
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_greeting_templates_used ON greeting_templates (last_used_at)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_greeting_templates_fp ON greeting_templates (fingerprint)"
+    )
+
+
+def _migrate_workers(cur, defaults):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id INTEGER PRIMARY KEY,
+            heartbeat_at DOUBLE PRECISION NOT NULL
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS send_leases (
+            chat_id BIGINT NOT NULL,
+            day TEXT NOT NULL,
+            worker_id INTEGER NOT NULL,
+            expires_at DOUBLE PRECISION NOT NULL,
+            done SMALLINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, day)
+        )
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_send_leases_day ON send_leases (day)")
+
+
+def _migrate_outbox(cur, defaults):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id BIGSERIAL PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            day TEXT NOT NULL,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at DOUBLE PRECISION NOT NULL,
+            worker_id INTEGER,
+            lease_until DOUBLE PRECISION NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at DOUBLE PRECISION NOT NULL,
+            sent_at DOUBLE PRECISION,
+            UNIQUE (chat_id, day)
+        )
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_day ON outbox (day)")
+
+
+def _migrate_birthday_md_index(cur, defaults):
+    # План рассылки на сутки читает записи всех чатов за несколько дней (см. dayplan.py)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_birthdays_md ON birthdays (md)")
+
+
+def _migrate_chat_updated_at(cur, defaults):
+    # Время изменения настроек чата: воркеры подтягивают только изменённые чаты
+    cur.execute(
+        "ALTER TABLE chats ADD COLUMN IF NOT EXISTS updated_at DOUBLE PRECISION NOT NULL DEFAULT 0"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chats_updated ON chats (updated_at)")
+
+
+MIGRATIONS = [
+    _migrate_initial,
+    _migrate_chat_last_sent,
+    _migrate_chat_tz,
+    _migrate_greeting_templates,
+    _migrate_workers,
+    _migrate_outbox,
+    _migrate_birthday_md_index,
+    migrate_backfill_last_sent,
+    _migrate_chat_updated_at,
+]
+
+
+class _Cursor:
+    """Курсор psycopg2, понимающий плейсхолдеры «?» из общего SQL."""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    @staticmethod
+    def _sql(sql: str) -> str:
+        return sql.replace("%", "%%").replace("?", "%s")
+
+    def execute(self, sql, params=()):
+        self._cur.execute(self._sql(sql), params)
+        return self
+
+    def executemany(self, sql, seq):
+        # Пачками по 100 выражений за обмен с сервером вместо одного на строку
+        execute_batch(self._cur, self._sql(sql), seq)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+class PostgresStorage(Storage):
+    def __init__(self, dsn: str, min_connections: int = 1, max_connections: int = 8):
+        super().__init__()
+        self._pool = ThreadedConnectionPool(min_connections, max_connections, dsn)
+        self.max_workers = max_connections
+
+    @contextmanager
+    def _connect(self):
+        conn = self._pool.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def _cursor(self, conn):
+        return _Cursor(conn.cursor())
+
+    def migrate(self, default_hour: int, default_minute: int):
+        with self.transaction() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(?)", (_MIGRATION_LOCK_ID,))
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"
+            )
+            cur.execute("SELECT version FROM schema_version")
+            row = cur.fetchone()
+            if row is None:
+                cur.execute("INSERT INTO schema_version (version) VALUES (0)")
+                version = 0
+            else:
+                version = row[0]
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                migration(cur, (default_hour, default_minute))
+                cur.execute("UPDATE schema_version SET version = ?", (number,))
+
+    def close(self):
+        self._pool.closeall()
+
+    def get_birthdays_for_chats(self, chat_ids, month: int, day: int):
+        result: dict[int, list] = {}
+        with self._read() as cur:
+            cur.execute(
+                """
+                SELECT chat_id, id, user_id, name, date FROM birthdays
+                WHERE md = ? AND chat_id = ANY(?)
+                ORDER BY chat_id, id
+                """,
+                (month_day(month, day), list(chat_ids)),
+            )
+            for row in cur.fetchall():
+                result.setdefault(row[0], []).append((row[1], row[2], row[3], row[4]))
+        return result
+
+    def get_greetings(self, day: str, birthday_ids) -> dict[int, str]:
+        birthday_ids = list(birthday_ids)
+        if not birthday_ids:
+            return {}
+        with self._read() as cur:
+            cur.execute(
+                "SELECT birthday_id, text FROM greetings WHERE day = ? AND birthday_id = ANY(?)",
+                (day, birthday_ids),
+            )
+            rows = cur.fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def save_greetings(self, day: str, items):
+        rows = [(birthday_id, day, text) for birthday_id, text in items]
+        if not rows:
+            return
+        with self.transaction() as cur:
+            execute_values(
+                cur._cur,
+                """
+                INSERT INTO greetings (birthday_id, day, text) VALUES %s
+                ON CONFLICT (birthday_id, day) DO UPDATE SET text = EXCLUDED.text
+                """,
+                rows,
+            )
+
+    def claim_sends(self, chat_ids, day: str, worker_id: int, now: float, lease_seconds: float):
+        chat_ids = list(chat_ids)
+        if not chat_ids:
+            return []
+        with self.transaction() as cur:
+            cur.execute(
+                """
+                INSERT INTO send_leases (chat_id, day, worker_id, expires_at, done)
+                SELECT id, ?, ?, ?, 0 FROM unnest(?::bigint[]) AS id
+                ON CONFLICT (chat_id, day) DO UPDATE
+                SET worker_id = EXCLUDED.worker_id, expires_at = EXCLUDED.expires_at
+                WHERE send_leases.done = 0
+                  AND (send_leases.expires_at < ? OR send_leases.worker_id = EXCLUDED.worker_id)
+                RETURNING chat_id
+                """,
+                (day, worker_id, now + lease_seconds, chat_ids, now),
+            )
+            rows = cur.fetchall()
+        return [row[0] for row in rows]
+
+    def claim_outbox(self, worker_id: int, now: float, lease_seconds: float, limit: int):
+        with self.transaction() as cur:
+            cur.execute(
+                """
+                UPDATE outbox SET worker_id = ?, lease_until = ?
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ? AND lease_until < ?
+                    ORDER BY next_attempt_at, id LIMIT ?
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, chat_id, text, attempts
+                """,
+                (worker_id, now + lease_seconds, now, now, limit),
+            )
+            rows = cur.fetchall()
+        return sorted(tuple(row) for row in rows)
+
+    def get_unsent_chats(self, chat_ids, day: str) -> list[int]:
+        with self._read() as cur:
+            cur.execute(
+                """
+                SELECT chat_id FROM chats
+                WHERE chat_id = ANY(?) AND (last_sent_date IS NULL OR last_sent_date < ?)
+                """,
+                (list(chat_ids), day),
+            )
+            rows = cur.fetchall()
+        return [row[0] for row in rows]
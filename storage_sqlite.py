@@ -0,0 +1,340 @@
+# storage_sqlite.py
+"""SQLite-хранилище (по умолчанию, файл в постоянном хранилище Amvera)."""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import schedule
+from storage import Storage, migrate_backfill_last_sent, month_day
+
+
+# ==== МИГРАЦИИ СХЕМЫ ====
+# Номер последней применённой миграции хранится в PRAGMA user_version.
+# Новые изменения схемы добавляются в конец MIGRATIONS и не правятся задним числом.
+
+def _add_column(cur, table: str, column: str, decl: str):
+    columns = {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _migrate_base_tables(cur, defaults):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS birthdays (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            date TEXT NOT NULL
+        );
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id INTEGER PRIMARY KEY,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            hour INTEGER,
+            minute INTEGER
+        );
+        """
+    )
+
+
+def _migrate_chat_send_minute(cur, defaults):
+    # Минута суток для индекса расписания
+    _add_column(cur, "chats", "send_minute", "INTEGER")
+    cur.execute(
+        """
+        UPDATE chats
+        SET send_minute = COALESCE(hour, ?) * 60 + COALESCE(minute, ?)
+        WHERE send_minute IS NULL
+        """,
+        defaults,
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chats_schedule ON chats (enabled, send_minute)"
+    )
+
+
+def _migrate_greetings(cur, defaults):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS greetings (
+            birthday_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (birthday_id, day)
+        );
+        """
+    )
+
+
+def _migrate_birthday_md(cur, defaults):
+    # md = месяц * 100 + день, чтобы искать дни рождения по индексу
+    _add_column(cur, "birthdays", "md", "INTEGER")
+    cur.execute(
+        """
+        UPDATE birthdays
+        SET md = CAST(substr(date, 6, 2) AS INTEGER) * 100
+               + CAST(substr(date, 9, 2) AS INTEGER)
+        WHERE md IS NULL
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_birthdays_chat_md ON birthdays (chat_id, md)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_birthdays_chat_user ON birthdays (chat_id, user_id)"
+    )
+
+
+def _migrate_chat_last_sent(cur, defaults):
+    # Дата последней рассылки: после рестарта не пропускаем и не дублируем день
+    _add_column(cur, "chats", "last_sent_date", "TEXT")
+
+
+def _migrate_chat_tz(cur, defaults):
+    # Пояс чата и заранее посчитанное смещение: индекс расписания по минуте UTC
+    offset = schedule.utc_offset(None)
+    _add_column(cur, "chats", "tz", "TEXT")
+    _add_column(cur, "chats", "utc_offset", "INTEGER")
+    _add_column(cur, "chats", "send_minute_utc", "INTEGER")
+    cur.execute(
+        """
+        UPDATE chats
+        SET utc_offset = ?,
+            send_minute_utc = ((send_minute - ?) % 1440 + 1440) % 1440
+        WHERE utc_offset IS NULL
+        """,
+        (offset, offset),
+    )
+    cur.execute("DROP INDEX IF EXISTS idx_chats_schedule")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chats_schedule_utc ON chats (enabled, send_minute_utc)"
+    )
+
+
+def _migrate_greeting_templates(cur, defaults):
+    # Пул шаблонов поздравлений с меткой имени, общий для всех чатов
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS greeting_templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fingerprint TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        );
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_greeting_templates_used ON greeting_templates (last_used_at)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_greeting_templates_fp ON greeting_templates (fingerprint)"
+    )
+
+
+def _migrate_workers(cur, defaults):
+    # Несколько воркеров с общей базой: пульс и аренды ежедневных рассылок
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id INTEGER PRIMARY KEY,
+            heartbeat_at REAL NOT NULL
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS send_leases (
+            chat_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            worker_id INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, day)
+        );
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_send_leases_day ON send_leases (day)")
+
+
+def _migrate_outbox(cur, defaults):
+    # Готовые ежедневные сообщения до доставки в Telegram (см. outbox.py)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            worker_id INTEGER,
+            lease_until REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL,
+            UNIQUE (chat_id, day)
+        );
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_day ON outbox (day)")
+
+
+def _migrate_birthday_md_index(cur, defaults):
+    # План рассылки на сутки читает записи всех чатов за несколько дней (см. dayplan.py)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_birthdays_md ON birthdays (md)")
+
+
+def _migrate_chat_updated_at(cur, defaults):
+    # Время изменения настроек чата: воркеры подтягивают только изменённые чаты
+    _add_column(cur, "chats", "updated_at", "REAL NOT NULL DEFAULT 0")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chats_updated ON chats (updated_at)")
+
+
+MIGRATIONS = [
+    _migrate_base_tables,
+    _migrate_chat_send_minute,
+    _migrate_greetings,
+    _migrate_birthday_md,
+    _migrate_chat_last_sent,
+    _migrate_chat_tz,
+    _migrate_greeting_templates,
+    _migrate_workers,
+    _migrate_outbox,
+    _migrate_birthday_md_index,
+    migrate_backfill_last_sent,
+    _migrate_chat_updated_at,
+]
+
+
+class SQLiteStorage(Storage):
+    """
+    Одно долгоживущее соединение на процесс вместо connect/close на каждый
+    вызов. Доступ сериализуется блокировкой, поэтому check_same_thread не нужен.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.RLock()
+
+    def get_conn(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(
+                    self.path,
+                    check_same_thread=False,
+                    isolation_level=None,  # транзакции открываем сами в transaction()
+                    cached_statements=256,
+                )
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA synchronous = NORMAL")
+                conn.execute("PRAGMA cache_size = -8000")  # ~8 МБ
+                conn.execute("PRAGMA temp_store = MEMORY")
+                conn.execute("PRAGMA busy_timeout = 5000")
+                self._conn = conn
+            return self._conn
+
+    @contextmanager
+    def _connect(self):
+        with self._lock:
+            yield self.get_conn()
+
+    def _begin(self, conn):
+        conn.execute("BEGIN")
+
+    def _commit(self, conn):
+        conn.execute("COMMIT")
+
+    def _rollback(self, conn):
+        conn.execute("ROLLBACK")
+
+    @contextmanager
+    def _read(self):
+        # Чтение в autocommit-режиме, без BEGIN/COMMIT
+        if getattr(self._local, "cursor", None) is not None:
+            yield self._local.cursor
+            return
+        with self._connect() as conn:
+            yield conn.cursor()
+
+    def migrate(self, default_hour: int, default_minute: int):
+        with self._read() as cur:
+            version = cur.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            with self.transaction() as cur:
+                migration(cur, (default_hour, default_minute))
+                cur.execute(f"PRAGMA user_version = {number}")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get_birthdays_for_chats(self, chat_ids, month: int, day: int):
+        chat_ids = list(chat_ids)
+        md = month_day(month, day)
+        result: dict[int, list] = {}
+        with self._read() as cur:
+            # Не упираемся в лимит параметров SQLite
+            for i in range(0, len(chat_ids), 500):
+                chunk = chat_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cur.execute(
+                    f"""
+                    SELECT chat_id, id, user_id, name, date FROM birthdays
+                    WHERE md = ? AND chat_id IN ({placeholders})
+                    ORDER BY chat_id, id
+                    """,
+                    (md, *chunk),
+                )
+                for row in cur.fetchall():
+                    result.setdefault(row[0], []).append((row[1], row[2], row[3], row[4]))
+        return result
+
+    def get_greetings(self, day: str, birthday_ids) -> dict[int, str]:
+        birthday_ids = list(birthday_ids)
+        if not birthday_ids:
+            return {}
+        result = {}
+        with self._read() as cur:
+            for i in range(0, len(birthday_ids), 500):
+                chunk = birthday_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cur.execute(
+                    f"SELECT birthday_id, text FROM greetings WHERE day = ? AND birthday_id IN ({placeholders})",
+                    (day, *chunk),
+                )
+                result.update((row[0], row[1]) for row in cur.fetchall())
+        return result
+
+    def get_unsent_chats(self, chat_ids, day: str) -> list[int]:
+        chat_ids = list(chat_ids)
+        result = []
+        with self._read() as cur:
+            for i in range(0, len(chat_ids), 500):
+                chunk = chat_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cur.execute(
+                    f"""
+                    SELECT chat_id FROM chats
+                    WHERE chat_id IN ({placeholders})
+                      AND (last_sent_date IS NULL OR last_sent_date < ?)
+                    """,
+                    (*chunk, day),
+                )
+                result.extend(row[0] for row in cur.fetchall())
+        return result
@@ -0,0 +1,118 @@
+# tracing.py
+"""
+Трассировка обработки апдейтов: из чего складывается время команды.
+
+Трасса открывается обработчиком begin (TypeHandler в группе
+TRACE_BEGIN_GROUP, раньше всех) и закрывается finish (в группе
+TRACE_END_GROUP, после всех). Пока она открыта, вызовы базы
+(db_async.run), Telegram Bot API (TracedRequest) и внешних HTTP API
+(http_client) записывают в неё отрезки span. Трасса живёт в contextvar
+задачи апдейта, поэтому параллельные апдейты не смешиваются.
+
+Длительность апдейта попадает в метрику bot_update_seconds, а апдейты
+дольше TRACE_SLOW_SECONDS пишутся в лог с разбивкой по отрезкам.
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+
+from telegram import Update
+from telegram.request import HTTPXRequest
+
+from config import TRACE_SLOW_SECONDS
+from metrics import UPDATE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+TRACE_BEGIN_GROUP = -100
+TRACE_END_GROUP = 100
+
+# Сколько разных видов апдейтов держать в метке метрики; остальные — "other"
+_MAX_KINDS = 50
+_kinds: set[str] = set()
+
+
+class Trace:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.started = time.perf_counter()
+        # имя отрезка -> [число вызовов, суммарная длительность]
+        self.spans: dict[str, list] = {}
+
+    def add(self, name: str, seconds: float):
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [1, seconds]
+        else:
+            span[0] += 1
+            span[1] += seconds
+
+    def breakdown(self) -> str:
+        ordered = sorted(self.spans.items(), key=lambda item: item[1][1], reverse=True)
+        return ", ".join(
+            f"{name} {total * 1000:.0f}ms×{count}" for name, (count, total) in ordered
+        ) or "-"
+
+
+_current: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("trace", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """Отрезок текущей трассы; вне апдейта ничего не делает."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+def _kind(update: Update) -> str:
+    message = update.effective_message
+    if update.callback_query is not None:
+        kind = "callback"
+    elif message is not None and (message.text or message.caption or "").startswith("/"):
+        kind = (message.text or message.caption).split()[0].split("@")[0]
+    elif update.chat_member is not None or update.my_chat_member is not None:
+        kind = "chat_member"
+    else:
+        kind = "message" if message is not None else "other"
+    # Метки метрик не должны расти от произвольных /команд пользователей
+    if kind not in _kinds:
+        if len(_kinds) >= _MAX_KINDS or len(kind) > 32:
+            return "other"
+        _kinds.add(kind)
+    return kind
+
+
+async def begin(update: object, context):
+    if isinstance(update, Update):
+        _current.set(Trace(_kind(update)))
+
+
+async def finish(update: object, context):
+    trace = _current.get()
+    if trace is None:
+        return
+    _current.set(None)
+    elapsed = time.perf_counter() - trace.started
+    UPDATE_SECONDS.observe(trace.kind, value=elapsed)
+    if elapsed >= TRACE_SLOW_SECONDS:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        logger.warning(
+            "Slow update %s in chat %s: %.0f ms (%s)",
+            trace.kind, chat.id if chat else None, elapsed * 1000, trace.breakdown(),
+        )
+
+
+class TracedRequest(HTTPXRequest):
+    """Запросы к Bot API как отрезки telegram.<метод> текущей трассы."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        with span("telegram." + url.rsplit("/", 1)[-1]):
+            return await super().do_request(url, method, *args, **kwargs)
@@ -0,0 +1,49 @@
+# webhook.py
+"""
+Приём апдейтов через webhook на общем HTTP-сервере (http_server.py).
+
+Telegram присылает POST на WEBHOOK_PATH с секретом в заголовке
+X-Telegram-Bot-Api-Secret-Token; апдейт кладётся в app.update_queue,
+а отвечаем сразу — обработка идёт параллельно (concurrent_updates).
+"""
+import hmac
+import json
+import logging
+
+from telegram import Update
+
+import http_server
+from config import WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def install(app):
+    """Регистрирует маршрут webhook; вызывать до http_server.start."""
+
+    async def receive(request: http_server.Request) -> http_server.Response:
+        secret = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(secret.encode(), WEBHOOK_SECRET.encode()):
+            return http_server.Response(403)
+        try:
+            update = Update.de_json(json.loads(request.body), app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Bad webhook payload: %s", e)
+            return http_server.Response(400)
+        await app.update_queue.put(update)
+        return http_server.Response(200)
+
+    http_server.add_route("POST", WEBHOOK_PATH, receive)
+
+
+async def register(app, allowed_updates):
+    """Сообщает Telegram адрес webhook (setWebhook)."""
+    url = WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH
+    await app.bot.set_webhook(
+        url=url,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=allowed_updates,
+    )
+    logger.info("Webhook set to %s", url)
@@ -1,8 +1,12 @@
 # yandex_gpt.py
+import hashlib
+import json
 import os
-import requests
 from config import YANDEX_API_KEY, YANDEX_FOLDER_ID, YANDEX_ENDPOINT, YANDEX_MODEL
 
+import http_client
+from resilience import llm_api
+
 YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
 YANDEX_FOLDER_ID = os.getenv("YANDEX_FOLDER_ID")
 YANDEX_ENDPOINT = os.getenv(
@@ -14,18 +18,18 @@ YANDEX_MODEL = os.getenv(
     f"gpt://{YANDEX_FOLDER_ID}/yandexgpt-lite",
 )
 
+# Метка имени в шаблонах поздравлений (см. greeting_pool.py)
+NAME_PLACEHOLDER = "{name}"
 
-def generate_birthday_text(name_html: str) -> str:
-    """
-    Весёлое поздравление через YandexGPT, fallback — статичное.
-    [web:160][web:170][web:172]
-    """
-    if not (YANDEX_API_KEY and YANDEX_FOLDER_ID):
-        return (
-            f"🎉 Сегодня день рождения у {name_html}! "
-            f"Желаю здоровья, вдохновения и мощных результатов во всех проектах! 🥳"
-        )
 
+def fallback_text(name_html: str) -> str:
+    return (
+        f"🎉 Сегодня день рождения у {name_html}! "
+        f"Желаю здоровья, вдохновения и мощных результатов во всех проектах! 🥳"
+    )
+
+
+def _build_request(name_html: str, as_template: bool = False):
     headers = {
         "Authorization": f"Api-Key {YANDEX_API_KEY}",
         "Content-Type": "application/json",
@@ -37,6 +41,8 @@ def generate_birthday_text(name_html: str) -> str:
         "на «ты», максимум 2 предложения. "
         f"Обращайся по имени: {name_html}."
     )
+    if as_template:
+        prompt += f" Имя напиши ровно как {NAME_PLACEHOLDER}, без изменений."
 
     body = {
         "modelUri": YANDEX_MODEL,
@@ -53,20 +59,62 @@ def generate_birthday_text(name_html: str) -> str:
             {"role": "user", "text": prompt},
         ],
     }
+    return headers, body
+
+
+def _parse_response(data) -> str:
+    alt = data["result"]["alternatives"][0]
+    text = alt["message"]["text"].strip()
+    if "🎉" not in text and "🥳" not in text:
+        text = "🎉 " + text
+    return text
 
+
+def prompt_fingerprint() -> str:
+    """
+    Отпечаток запроса шаблона (модель, промпт, параметры) без имени:
+    при смене промпта или модели старые шаблоны перестают подходить.
+    """
+    _, body = _build_request(NAME_PLACEHOLDER, as_template=True)
+    raw = json.dumps(body, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+async def generate_birthday_text_async(name_html: str) -> str:
+    """
+    Весёлое поздравление через YandexGPT, fallback — статичное.
+    [web:160][web:170][web:172]
+    """
+    if not (YANDEX_API_KEY and YANDEX_FOLDER_ID):
+        return fallback_text(name_html)
+
+    headers, body = _build_request(name_html)
     try:
-        resp = requests.post(
-            YANDEX_ENDPOINT, headers=headers, json=body, timeout=10
+        data = await llm_api.call(
+            lambda timeout: http_client.post_json(
+                YANDEX_ENDPOINT, body, timeout=timeout, headers=headers
+            )
         )
-        resp.raise_for_status()
-        data = resp.json()
-        alt = data["result"]["alternatives"][0]
-        text = alt["message"]["text"].strip()
-        if "🎉" not in text and "🥳" not in text:
-            text = "🎉 " + text
-        return text
+        return _parse_response(data)
     except Exception:
-        return (
-            f"🎉 Сегодня день рождения у {name_html}! "
-            f"Желаю здоровья, вдохновения и мощных результатов во всех проектах! 🥳"
+        # В том числе CircuitOpen: модель недавно не отвечала, не ждём таймаут
+        return fallback_text(name_html)
+
+
+async def generate_template_async() -> str | None:
+    """Шаблон поздравления с NAME_PLACEHOLDER вместо имени; None при сбое."""
+    if not (YANDEX_API_KEY and YANDEX_FOLDER_ID):
+        return None
+
+    headers, body = _build_request(NAME_PLACEHOLDER, as_template=True)
+    try:
+        data = await llm_api.call(
+            lambda timeout: http_client.post_json(
+                YANDEX_ENDPOINT, body, timeout=timeout, headers=headers
+            )
         )
+        text = _parse_response(data)
+    except Exception:
+        return None
+    # Модель могла переписать или продублировать метку — такой шаблон не годится
+    return text if text.count(NAME_PLACEHOLDER) == 1 else None